@@ -0,0 +1,319 @@
+"""
+Benchmarks of McCabeThieleLogic, tools and the view update path.
+
+    python -m benchmarks.bench                        run all, compare with benchmarks/baseline.json if it exists
+    python -m benchmarks.bench -k lines -o out.json   only names containing 'lines', results as json
+    python -m benchmarks.bench --save-baseline        store the results as the new baseline
+
+Every benchmark times one call of a function, the setup isn't timed.
+Results are seconds per call, the minimum and median of --repeat runs.
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
+from tools import chemistry, lines
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Slower than the baseline by more than this factor is a regression
+DEFAULT_THRESHOLD = 1.25
+ARRAY_SIZE = 100_000
+
+# name -> function that does the setup and returns the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _register_make_all_lines(dependent_variable):
+    @benchmark(f"logic.make_all_lines[{dependent_variable}]")
+    def setup():
+        logic = McCabeThieleLogic(target_stages=12.0)
+        logic.dependent_variable = dependent_variable
+
+        def run():
+            # Everything is recomputed, not just what changed
+            logic.dirty.update(logic.STAGES)
+            logic.make_all_lines()
+        return run
+
+
+for _dependent_variable in McCabeThieleLogic.DEPENDENT_VARS:
+    _register_make_all_lines(_dependent_variable)
+
+
+def _register_equilibrium_points(alpha, r, n_stages):
+    @benchmark(f"logic.make_equilibrium_points[{n_stages} stages]")
+    def setup():
+        logic = McCabeThieleLogic(xf=0.5, xd=0.999, xb=0.001, alpha=alpha, r=r, q=1.0, max_eq_array_size=100_000)
+        logic.dependent_variable = 'B'
+        logic.make_all_lines()
+        if logic.n_eq_points != n_stages:
+            raise ValueError(f"Benchmark case has {logic.n_eq_points} stages, not {n_stages}. ")
+        return logic.make_equilibrium_points
+
+
+_register_equilibrium_points(1.85, 3.0, 43)
+_register_equilibrium_points(1.05, 100.0, 359)
+_register_equilibrium_points(1.02, 300.0, 843)
+
+
+@benchmark("chemistry.vapor_liquid_equilibrium[scalar]")
+def _():
+    return lambda: chemistry.vapor_liquid_equilibrium(0.4, 1.85)
+
+
+@benchmark("chemistry.vapor_liquid_equilibrium[array]")
+def _():
+    x = np.linspace(0.0, 1.0, ARRAY_SIZE)
+    return lambda: chemistry.vapor_liquid_equilibrium(x, 1.85)
+
+
+@benchmark("chemistry.smoker_column_stages[array]")
+def _():
+    rng = np.random.default_rng(0)
+    alpha = rng.uniform(1.5, 4.0, ARRAY_SIZE)
+    r = rng.uniform(2.0, 6.0, ARRAY_SIZE)
+    rectifying = r / (r + 1), 0.93 / (r + 1)
+    stripping = 1.1, -0.1 * 0.04
+    y_switch = rectifying[0] * 0.6 + rectifying[1]
+    return lambda: chemistry.smoker_column_stages(0.04, 0.93, alpha, rectifying, stripping, y_switch)
+
+
+@benchmark("lines.intersect[scalar]")
+def _():
+    return lambda: lines.intersect(0.75, 0.2, 1.2, -0.01)
+
+
+@benchmark("lines.intersect[array]")
+def _():
+    rng = np.random.default_rng(0)
+    a1, b1, a2, b2 = rng.uniform(-2.0, 2.0, (4, ARRAY_SIZE))
+    return lambda: lines.intersect_vectorized(a1, b1, a2, b2)
+
+
+@benchmark("lines.through_points[scalar]")
+def _():
+    return lambda: lines.through_points(0.2, 0.3, 0.7, 0.9)
+
+
+@benchmark("lines.through_points[array]")
+def _():
+    rng = np.random.default_rng(0)
+    x1, y1, x2, y2 = rng.uniform(0.0, 1.0, (4, ARRAY_SIZE))
+    return lambda: lines.through_points_vectorized(x1, y1, x2, y2)
+
+
+@benchmark("lines.intersect_from_slope_and_point[scalar]")
+def _():
+    return lambda: lines.intersect_from_slope_and_point(0.75, 0.5, 0.6)
+
+
+@benchmark("lines.intersect_from_slope_and_point[array]")
+def _():
+    rng = np.random.default_rng(0)
+    a, x, y = rng.uniform(-2.0, 2.0, (3, ARRAY_SIZE))
+    return lambda: lines.intersect_from_slope_and_point_vectorized(a, x, y)
+
+
+def _register_view(render_mode):
+    @benchmark(f"view.update_all[{render_mode}]")
+    def setup():
+        import matplotlib
+        matplotlib.use('Agg')
+        from src.mccabe_thiele.McCabeThieleView import McCabeThieleView
+
+        view = McCabeThieleView(render_mode=render_mode, threaded=False)
+        view.init_figure()
+        view.ax.figure.canvas.draw()
+        # More values than the view caches, so every update is solved
+        values = itertools.cycle(np.linspace(1.0, 6.0, 2 * view.CACHE_SIZE + 1))
+        slider = view.sliders['R']
+
+        def run():
+            slider.set_val(next(values))
+            view.update_all()
+        return run
+
+
+_register_view('full')
+_register_view('blit')
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that batch workers import, they must not load matplotlib
+COMPUTE_MODULES = ('tools.lines', 'tools.chemistry', 'tools.vle', 'tools.roots', 'tools.stats',
+                   'src.mccabe_thiele.McCabeThieleLogic', 'src.mccabe_thiele.McCabeThieleBatch',
+                   'src.mccabe_thiele.McCabeThieleSweep', 'src.mccabe_thiele.McCabeThieleCli',
+                   'src.mccabe_thiele.McCabeThieleDesign', 'src.mccabe_thiele.McCabeThieleSensitivity',
+                   'src.mccabe_thiele.McCabeThieleMonteCarlo', 'src.mccabe_thiele.McCabeThieleTable')
+GUI_MODULES = ('src.mccabe_thiele.McCabeThieleView',)
+
+
+def imported_modules(module):
+    """Names of every module a fresh interpreter has loaded after importing module."""
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return set(output.split())
+
+
+def _register_import(module):
+    # Startup of a fresh interpreter that imports module, what a spawned worker pays, just Python for None
+    @benchmark(f"import[{module.rsplit('.', 1)[-1] if module else 'python'}]")
+    def setup():
+        if module in COMPUTE_MODULES and 'matplotlib' in imported_modules(module):
+            raise ValueError(f"Importing {module} loads matplotlib. ")
+        command = [sys.executable, '-c', f"import {module}" if module else "pass"]
+        return lambda: subprocess.run(command, cwd=ROOT, check=True)
+
+
+_register_import(None)
+for _module in (*COMPUTE_MODULES, *GUI_MODULES):
+    _register_import(_module)
+
+
+def time_call(func, repeat=5, min_time=0.05):
+    """Seconds per call of func, min and median of repeat runs, each with enough calls to take min_time."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = [t / number for t in timer.repeat(repeat, number)]
+    return {'number': number, 'repeat': repeat, 'min': min(times), 'median': statistics.median(times)}
+
+
+def select(pattern=None):
+    """Names of the benchmarks that contain pattern, which can be a glob like 'lines*array'."""
+    if pattern is None:
+        return list(BENCHMARKS)
+    return [name for name in BENCHMARKS if fnmatch.fnmatchcase(name, f"*{pattern}*")]
+
+
+def run(names=None, repeat=5, min_time=0.05, progress=None):
+    """Run the benchmarks, all by default, returns a json serializable dict with metadata and results."""
+    names = names if names is not None else list(BENCHMARKS)
+    results = {}
+    for name in names:
+        results[name] = time_call(BENCHMARKS[name](), repeat, min_time)
+        if progress is not None:
+            progress(name, results[name])
+    return {'metadata': metadata(), 'results': results}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the min times of 2 outputs of run.
+    Returns a dict of name -> (ratio, status), ratio is new / baseline time,
+    status is 'slower' or 'faster' when the ratio is past threshold, 'same' otherwise, 'new' without a baseline.
+    """
+    comparison = {}
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            comparison[name] = (None, 'new')
+            continue
+        ratio = result['min'] / baseline['results'][name]['min']
+        if ratio > threshold:
+            status = 'slower'
+        elif ratio < 1 / threshold:
+            status = 'faster'
+        else:
+            status = 'same'
+        comparison[name] = (ratio, status)
+    return comparison
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def print_result(name, result):
+    print(f"{name:50s} {format_time(result['min']):>10s} {format_time(result['median']):>10s}", file=sys.stderr)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description="Run the benchmarks.")
+    parser.add_argument('-k', '--select', default=None, help="only benchmarks with this glob in their name")
+    parser.add_argument('-o', '--output', default=None, help="write the results as json to this file, - for stdout")
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help="seconds each repeat takes at least")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="json results to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results to --baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="slowdown factor that fails the run")
+    parser.add_argument('-l', '--list', action='store_true', help="list the benchmarks and exit")
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    names = select(args.select)
+    if args.list:
+        print('\n'.join(names))
+        return 0
+    if not names:
+        raise ValueError(f"No benchmarks match '{args.select}'. ")
+
+    print(f"{'benchmark':50s} {'min':>10s} {'median':>10s}", file=sys.stderr)
+    results = run(names, args.repeat, args.min_time, print_result)
+
+    if args.output is not None:
+        text = json.dumps(results, indent=1)
+        if '-' == args.output:
+            print(text)
+        else:
+            with open(args.output, 'w') as file:
+                file.write(text + '\n')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=1)
+            file.write('\n')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    comparison = compare(results, baseline, args.threshold)
+    print(f"\nCompared with {args.baseline} ({baseline['metadata'].get('commit')}):", file=sys.stderr)
+    for name, (ratio, status) in comparison.items():
+        print(f"{name:50s} {'' if ratio is None else f'{ratio:.2f}x':>10s} {status}", file=sys.stderr)
+    return 1 if any('slower' == status for _, status in comparison.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
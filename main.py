@@ -1,8 +1,14 @@
-
-from src.mccabe_thiele.McCabeThieleView import McCabeThieleView
+import sys
 
 
 def main():
+    # python main.py solve [options]: command line batch solver, see McCabeThieleCli
+    if len(sys.argv) > 1 and 'solve' == sys.argv[1]:
+        from src.mccabe_thiele.McCabeThieleCli import main as cli_main
+        cli_main(sys.argv[2:], prog="main.py solve")
+        return
+
+    from src.mccabe_thiele.McCabeThieleView import McCabeThieleView
     mctv1 = McCabeThieleView()
     mctv1.main()
 
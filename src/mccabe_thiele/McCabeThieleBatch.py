@@ -0,0 +1,457 @@
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
+from tools import chemistry, lines
+
+
+class McCabeThieleBatch:
+    """
+    Array version of McCabeThieleLogic.
+    Every variable can be a scalar or an array, they are broadcast against each other
+    and all cases are solved at once for a single dependent variable.
+    The formulas and the order of the steps are the same as in the logic class,
+    so every case gives the same numbers as solving it on its own.
+    Cases the logic class can't solve (parallel lines, division by zero) end up as nan or inf.
+    """
+
+    DEFAULTS = McCabeThieleLogic.DEFAULTS
+    DEFAULT_MAX_EQ_ARRAY_SIZE = McCabeThieleLogic.DEFAULT_MAX_EQ_ARRAY_SIZE
+    DEPENDENT_CASES = McCabeThieleLogic.DEPENDENT_CASES
+    DEPENDENT_VARS = McCabeThieleLogic.DEPENDENT_VARS
+    FOUND_LINES = McCabeThieleLogic.FOUND_LINES
+    variables_solved_for = McCabeThieleLogic.variables_solved_for
+    DEFAULT_DEPENDENT_VAR = McCabeThieleLogic.DEFAULT_DEPENDENT_VAR
+    STOP_REASONS = McCabeThieleLogic.STOP_REASONS
+    STAGE_METHODS = ('stepping', 'smoker', 'shortcut')
+    # What make_stages sets, the cross checks put it back afterwards
+    STAGE_OUTPUTS = ('n_eq_points', 'n_stages', 'stop_reason', 'pinch_x', 'feed_stage', 'stage_x')
+    SHORTCUT_STATISTICS = ('mean_error', 'mean_abs_error', 'max_abs_error', 'within_one_stage', 'mean_abs_feed_stage_error')
+
+    def __init__(self, xf=None, xd=None, xb=None, alpha=None, r=None, b=None, q=None, *,
+                 dependent_variable=None, max_eq_array_size=None, stage_method='stepping', vle_model=None,
+                 keep_stages=False, target_stages=None):
+        init_args = locals()
+        values = []
+        for var_name, default_value in self.DEFAULTS.items():
+            value = init_args.get(var_name.lower())
+            values.append(value if value is not None else default_value)
+        if target_stages is not None:
+            values.append(target_stages)
+
+        arrays = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in values))
+        self.variables = {var_name: array.copy() for var_name, array in zip(self.DEFAULTS, arrays)}
+        self.shape = arrays[0].shape
+        # Like McCabeThieleLogic.target_stages, broadcast with the variables
+        self.target_stages = arrays[-1].copy() if target_stages is not None else None
+
+        self._dependent_variable = self.DEFAULT_DEPENDENT_VAR
+        if dependent_variable is not None:
+            self.dependent_variable = dependent_variable
+
+        if stage_method not in self.STAGE_METHODS:
+            raise ValueError(f"Invalid stage method '{stage_method}'. ")
+        if stage_method in ('smoker', 'shortcut') and vle_model is not None:
+            raise ValueError(f"The {stage_method} stage method needs a constant alpha, not a vle_model. ")
+        self.stage_method = stage_method
+        # Like McCabeThieleLogic.vle_model, None uses the constant alpha of variables
+        self.vle_model = vle_model
+
+        self.max_eq_array_size = max_eq_array_size if max_eq_array_size is not None else self.DEFAULT_MAX_EQ_ARRAY_SIZE
+        self.n_eq_points = np.zeros(self.shape, dtype=int)
+        self.n_stages = np.full(self.shape, np.nan)
+        # Index into STOP_REASONS
+        self.stop_reason = np.zeros(self.shape, dtype=np.int8)
+        self.pinch_x = np.full(self.shape, np.nan)
+        # Counted from the top, by the stepping: the first stage below the rectifying section,
+        # the same convention as chemistry.shortcut_design
+        self.feed_stage = np.zeros(self.shape, dtype=int)
+        # With keep_stages the stepping also fills stage_x, the x of every row of McCabeThieleLogic.stages
+        self.keep_stages = keep_stages
+        self.stage_x = None
+
+        zeros = np.zeros(self.shape, dtype=float)
+        self.rectifying_coef = zeros, zeros
+        self.stripping_coef = zeros, zeros
+        self.q_line_coef = zeros, zeros
+        self.q_point = zeros, zeros
+
+        self._variable_calculators_dict = {
+            'xf': self._calculate_xf,
+            'xd': self._calculate_xd,
+            'xb': self._calculate_xb,
+            'R': self._calculate_r,
+            'B': self._calculate_b,
+            'q': self._calculate_q,
+            'alpha': self._calculate_alpha,
+        }
+        self._line_calculators_dict = {
+            'rectifying': self.calc_rectifying_line_coef,
+            'stripping': self.calc_stripping_line_coef,
+            'q_line': self.calc_q_line_coef,
+        }
+
+    @property
+    def dependent_variable(self):
+        return self._dependent_variable
+
+    @dependent_variable.setter
+    def dependent_variable(self, new_value):
+        if new_value not in self.DEPENDENT_VARS:
+            raise ValueError(f"Invalid dependent variable '{new_value}'. ")
+        self._dependent_variable = new_value
+
+    def solved_variables(self):
+        return self.variables_solved_for(self._dependent_variable)
+
+    def through_q_point(self, line):
+        found, _, steps = self.DEPENDENT_CASES[self._dependent_variable]
+        return line == found == steps[0]
+
+    def line_coef(self, line):
+        return getattr(self, f'{line}_coef')
+
+    def calc_rectifying_line_coef(self):
+        r = self.variables['R']
+        a = r / (r + 1)
+        if self.through_q_point('rectifying'):
+            b = lines.intersect_from_slope_and_point_vectorized(a, *self.q_point)
+        else:
+            b = self.variables['xd'] / (r + 1)
+        self.rectifying_coef = a, b
+
+    def calc_stripping_line_coef(self):
+        b = self.variables['B']
+        slope = (b + 1) / b
+        if self.through_q_point('stripping'):
+            intercept = lines.intersect_from_slope_and_point_vectorized(slope, *self.q_point)
+        else:
+            intercept = -self.variables['xb'] / b
+        self.stripping_coef = slope, intercept
+
+    def calc_q_line_coef(self):
+        q = self.variables['q']
+        vertical = 1 == q
+        slope = np.where(vertical, np.inf, q / (q - 1))
+
+        if self.through_q_point('q_line'):
+            intercept = lines.intersect_from_slope_and_point_vectorized(slope, *self.q_point)
+        else:
+            xf = self.variables['xf']
+            intercept = np.where(vertical, xf, -xf / (q - 1))
+        self.q_line_coef = slope, intercept
+
+    def calc_known_operating_lines(self):
+        for line in self.DEPENDENT_CASES[self._dependent_variable][1]:
+            self._line_calculators_dict[line]()
+
+    def calculate_q_point(self):
+        # A vertical q-line is handled by intersect_vectorized
+        self.q_point = lines.intersect_vectorized(
+            *(coef for line in self.DEPENDENT_CASES[self._dependent_variable][1] for coef in self.line_coef(line)))
+
+    def _slope_to(self, var):
+        x = self.variables[var]
+        return lines.through_points_vectorized(*self.q_point, x, x)[0]
+
+    def _calculate_q(self):
+        a = self._slope_to('xf')
+        ans = a / (a - 1)
+        ans = np.where(a == 0, 0.0, ans)
+        ans = np.where(a == 1, np.inf, ans)
+        self.variables['q'] = np.where(a == np.inf, 1.0, ans)
+
+    def _calculate_r(self):
+        a = self._slope_to('xd')
+        self.variables['R'] = np.where(a == 1, np.inf, a / (1 - a))
+
+    def _calculate_b(self):
+        a = self._slope_to('xb')
+        self.variables['B'] = np.where(a == 1, np.inf, 1 / (a - 1))
+
+    def _calculate_x(self, var, coef):
+        a, b = coef
+        self.variables[var] = np.where(np.isinf(a), b, np.where(1 == a, np.nan, b / (1 - a)))
+
+    def _calculate_xb(self):
+        self._calculate_x('xb', self.stripping_coef)
+
+    def _calculate_xf(self):
+        self._calculate_x('xf', self.q_line_coef)
+
+    def _calculate_xd(self):
+        self._calculate_x('xd', self.rectifying_coef)
+
+    def _calculate_alpha(self):
+        if self.vle_model is not None:
+            raise ValueError("alpha can only be dependent for a constant alpha, not with a vle_model. ")
+        if self.target_stages is None:
+            raise ValueError("alpha can only be dependent with target_stages. ")
+        self.variables['alpha'] = chemistry.alpha_for_stages(
+            self.target_stages, self.variables['xb'], self.variables['xd'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1])
+
+    def solve_dependent_var(self):
+        for step in self.DEPENDENT_CASES[self._dependent_variable][2]:
+            if step in self._line_calculators_dict:
+                self._line_calculators_dict[step]()
+            else:
+                self._variable_calculators_dict[step]()
+
+    def find_pinch(self):
+        """
+        Analytic pinch check of McCabeThieleLogic.find_pinch for all cases.
+        Sets pinch_x to the liquid composition of the pinch, nan where there is none,
+        and returns a boolean array of the pinched cases.
+        """
+        self.pinch_x = chemistry.column_pinch_composition(
+            self.variables['xb'], self.variables['xd'], self.variables['alpha'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1], self.vle_model)
+        return ~np.isnan(self.pinch_x)
+
+    def make_equilibrium_points(self):
+        """
+        Steps all cases at once, only the cases that haven't stopped yet are updated.
+        Stops like McCabeThieleLogic.make_equilibrium_points, stop_reason gets the index in STOP_REASONS.
+        Cases with a pinch found by find_pinch are never stepped.
+        Only the number of stages is kept, and with keep_stages the x of the staircase points in stage_x,
+        of shape (*shape, max_eq_array_size + 1), nan after the last point.
+        n_stages gets a fractional count, the last step only counts for the part of it in x up to xd,
+        inf when pinched and nan when capped.
+        """
+        xd = self.variables['xd']
+        alpha = self.variables['alpha']
+        strip_a, strip_b = self.stripping_coef
+        rect_a, rect_b = self.rectifying_coef
+
+        x = self.variables['xb'].copy()
+        n_eq_points = np.zeros(self.shape, dtype=int)
+        n_rectifying = np.zeros(self.shape, dtype=int)
+        last_step = np.zeros(self.shape, dtype=float)
+        stop_reason = np.full(self.shape, self.STOP_REASONS.index('cap'), dtype=np.int8)
+        stop_reason[~(x < xd)] = self.STOP_REASONS.index('xd')
+        pinched = self.find_pinch()
+        stop_reason[pinched] = self.STOP_REASONS.index('pinch')
+        active = np.flatnonzero((x < xd) & ~pinched)
+        if self.keep_stages:
+            stage_x = np.full((x.size, self.max_eq_array_size + 1), np.nan)
+            stage_x[:, 0] = x.ravel()
+        for _ in range(self.max_eq_array_size):
+            if 0 == active.size:
+                break
+            old = x.flat[active]
+            if self.vle_model is None:
+                new = chemistry.vapor_liquid_equilibrium(old, alpha.flat[active])
+            else:
+                new = self.vle_model(old)
+            strip = (new - strip_b.flat[active]) / strip_a.flat[active]
+            rect = (new - rect_b.flat[active]) / rect_a.flat[active]
+            on_rect = rect > strip
+            new = np.where(on_rect, rect, strip)
+
+            pinched = ~(new > old)
+            stop_reason.flat[active[pinched]] = self.STOP_REASONS.index('pinch')
+            active = active[~pinched]
+            new = new[~pinched]
+            old = old[~pinched]
+            n_rectifying.flat[active] += on_rect[~pinched]
+
+            x.flat[active] = new
+            n_eq_points.flat[active] += 1
+            if self.keep_stages:
+                stage_x[active, n_eq_points.flat[active]] = new
+            reached = ~(new < xd.flat[active])
+            stop_reason.flat[active[reached]] = self.STOP_REASONS.index('xd')
+            last_step.flat[active[reached]] = (xd.flat[active[reached]] - old[reached]) / (new[reached] - old[reached])
+            active = active[~reached]
+
+        self.n_eq_points = n_eq_points
+        self.stop_reason = stop_reason
+        self.feed_stage = n_rectifying + 1
+        stages = np.where(n_eq_points > 0, n_eq_points - 1 + last_step, 0.0)
+        self.n_stages = np.where(self.STOP_REASONS.index('xd') == stop_reason, stages,
+                                 np.where(self.STOP_REASONS.index('pinch') == stop_reason, np.inf, np.nan))
+        if self.keep_stages:
+            self.stage_x = stage_x.reshape(*self.shape, -1)
+
+    def stage_temperatures(self):
+        """
+        McCabeThieleLogic.stage_temperatures of all cases, from stage_x of a batch solved with keep_stages.
+        Stage i of every case is at [..., i], nan past the last stage.
+        """
+        if self.stage_x is None:
+            raise ValueError("Stage temperatures need a batch stepped with keep_stages. ")
+        if not hasattr(self.vle_model, 'temperature'):
+            raise ValueError("Stage temperatures need a vle_model with a temperature method. ")
+        x = self.stage_x[..., :-1]
+        on_stage = np.arange(x.shape[-1]) < self.n_eq_points[..., None]
+        return np.where(on_stage, self.vle_model.temperature(np.where(on_stage, x, 0.0)), np.nan)
+
+    def make_stages_smoker(self):
+        """
+        O(1) per case alternative to make_equilibrium_points, only for constant alpha.
+        n_stages gets the fractional number of stages, inf when pinched.
+        n_eq_points gets the number of steps, capped at max_eq_array_size like the stepping loop.
+        """
+        steps, stages = chemistry.smoker_column_stages(
+            self.variables['xb'], self.variables['xd'], self.variables['alpha'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1])
+        cap = self.max_eq_array_size
+        finite = np.isfinite(steps)
+        reason = np.where(steps > cap, self.STOP_REASONS.index('cap'), self.STOP_REASONS.index('xd'))
+        self.n_stages = stages
+        self.n_eq_points = np.where(finite, np.minimum(steps, cap), 0).astype(int)
+        self.stop_reason = np.where(finite, reason, self.STOP_REASONS.index('pinch')).astype(np.int8)
+
+    def shortcut(self):
+        """
+        Fenske-Underwood-Gilliland shortcut design of every case, from the variables of a solved batch.
+        Returns a dict of arrays, 'n_min', 'r_min', 'n_stages' and 'feed_stage', see chemistry.shortcut_design.
+        """
+        v = self.variables
+        n_min, r_min, n_stages, feed_stage = chemistry.shortcut_design(
+            v['xf'], v['xd'], v['xb'], v['alpha'], v['q'], v['R'])
+        return {'n_min': n_min, 'r_min': r_min, 'n_stages': n_stages, 'feed_stage': feed_stage}
+
+    def make_stages_shortcut(self):
+        """
+        Stage count from the shortcut design, only for constant alpha.
+        n_stages gets the fractional number of stages, inf at or below the minimum reflux ratio.
+        n_eq_points gets it rounded up, the feed stage is rounded.
+        """
+        design = self.shortcut()
+        stages = design['n_stages']
+        cap = self.max_eq_array_size
+        finite = np.isfinite(stages)
+        with np.errstate(invalid='ignore'):
+            steps = np.ceil(np.where(finite, stages, 0))
+            reason = np.where(steps > cap, self.STOP_REASONS.index('cap'), self.STOP_REASONS.index('xd'))
+            self.feed_stage = np.where(finite, np.round(design['feed_stage']), 0).astype(int)
+        self.n_stages = stages
+        self.n_eq_points = np.minimum(steps, cap).astype(int)
+        self.stop_reason = np.where(finite, reason, self.STOP_REASONS.index('pinch')).astype(np.int8)
+
+    def compare_shortcut(self):
+        """
+        Shortcut design against stepping, on an already solved batch, which is left as it was.
+        Returns a dict with the arrays 'stage_error', the shortcut fractional stages minus the stepped count,
+        and 'feed_stage_error', nan where stepping doesn't reach xd or the shortcut has no answer,
+        and summary statistics of the compared cases.
+        """
+        outputs = self._save_stage_outputs()
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            design = self.shortcut()
+            self.make_equilibrium_points()
+            stepped, stepped_reason, stepped_feed_stage = self.n_eq_points, self.stop_reason, self.feed_stage
+        self._restore_stage_outputs(outputs)
+        # Pinch and cap of the stepping leave nothing to compare with
+        compared = (self.STOP_REASONS.index('xd') == stepped_reason) & np.isfinite(design['n_stages'])
+        stage_error = np.where(compared, design['n_stages'] - stepped, np.nan)
+        feed_stage_error = np.where(compared, design['feed_stage'] - stepped_feed_stage, np.nan)
+        errors = stage_error[compared]
+        feed_stage_errors = feed_stage_error[compared]
+        report = {
+            'stage_error': stage_error,
+            'feed_stage_error': feed_stage_error,
+            'n_cases': int(stage_error.size),
+            'n_compared': int(errors.size),
+        }
+        report.update(dict.fromkeys(self.SHORTCUT_STATISTICS, np.nan))
+        if errors.size:
+            report.update({
+                'mean_error': float(np.mean(errors)),
+                'mean_abs_error': float(np.mean(np.abs(errors))),
+                'max_abs_error': float(np.max(np.abs(errors))),
+                'within_one_stage': float(np.mean(np.abs(errors) <= 1)),
+                'mean_abs_feed_stage_error': float(np.mean(np.abs(feed_stage_errors))),
+            })
+        return report
+
+    def _save_stage_outputs(self):
+        return {name: getattr(self, name) for name in self.STAGE_OUTPUTS}
+
+    def _restore_stage_outputs(self, outputs):
+        for name, value in outputs.items():
+            setattr(self, name, value)
+
+    def cross_check_stages(self):
+        """
+        Count the stages with both methods, on an already solved batch, which is left as it was.
+        Returns a boolean array that is True where only one method reaches xd,
+        or where both do but with a different count.
+        """
+        outputs = self._save_stage_outputs()
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            self.make_equilibrium_points()
+            stepped, stepped_reason = self.n_eq_points, self.stop_reason
+            self.make_stages_smoker()
+            smoker, smoker_reason = self.n_eq_points, self.stop_reason
+        self._restore_stage_outputs(outputs)
+        stepped_done = self.STOP_REASONS.index('xd') == stepped_reason
+        smoker_done = self.STOP_REASONS.index('xd') == smoker_reason
+        return (stepped_done != smoker_done) | (stepped_done & (stepped != smoker))
+
+    def minimum_reflux(self):
+        v = self.variables
+        return chemistry.minimum_reflux(v['xf'], v['xd'], v['alpha'], v['q'])
+
+    def minimum_boilup(self):
+        v = self.variables
+        return chemistry.minimum_boilup(v['xf'], v['xb'], v['alpha'], v['q'])
+
+    def minimum_stages(self):
+        v = self.variables
+        return chemistry.minimum_stages(v['xd'], v['xb'], v['alpha'])
+
+    def reflux_multiple(self):
+        """R as a multiple of the minimum reflux ratio, use after make_all_lines when R is dependent."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.variables['R'] / self.minimum_reflux()
+
+    def make_stages(self):
+        if 'smoker' == self.stage_method:
+            self.make_stages_smoker()
+        elif 'shortcut' == self.stage_method:
+            self.make_stages_shortcut()
+        else:
+            self.make_equilibrium_points()
+
+    def make_all_lines(self):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            self.calc_known_operating_lines()
+            self.calculate_q_point()
+            self.solve_dependent_var()
+            self.make_stages()
+        return self
+
+
+def solve(dependent_variable=None, max_eq_array_size=None, stage_method='stepping', vle_model=None,
+          keep_stages=False, target_stages=None, **variables):
+    """
+    Solve a batch of cases in one call.
+    variables use the same names as McCabeThieleLogic.DEFAULTS, missing ones get the default value.
+    target_stages is only used, and needed, when alpha is the dependent variable.
+    Returns the solved McCabeThieleBatch.
+    """
+    unknown = set(variables) - set(McCabeThieleBatch.DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown variables {sorted(unknown)}. ")
+    kwargs = {var_name.lower(): value for var_name, value in variables.items()}
+    batch = McCabeThieleBatch(**kwargs, dependent_variable=dependent_variable,
+                              max_eq_array_size=max_eq_array_size, stage_method=stage_method, vle_model=vle_model,
+                              keep_stages=keep_stages, target_stages=target_stages)
+    return batch.make_all_lines()
+
+
+def format_shortcut_report(report):
+    """Text version of the summary of McCabeThieleBatch.compare_shortcut."""
+    rows = [f"Shortcut vs stepping, {report['n_compared']} of {report['n_cases']} cases compared"]
+    rows.extend(f"{name:28s} {report[name]:.3f}" for name in McCabeThieleBatch.SHORTCUT_STATISTICS)
+    return '\n'.join(rows)
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import os
+import sys
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch, solve
+
+OUTPUT_COLUMNS = (*McCabeThieleBatch.DEFAULTS, 'q_point_x', 'q_point_y', 'n_eq_points', 'status')
+
+
+def _parse_column(name, column, first_line):
+    values = np.empty(len(column), dtype=float)
+    for i, value in enumerate(column):
+        try:
+            values[i] = float(value) if value.strip() else np.nan
+        except ValueError:
+            raise ValueError(f"Line {first_line + i}: {value!r} in column '{name}' is not a number. ") from None
+    return values
+
+
+def solve_rows(header, rows, dependent_variable, stage_method='stepping', max_eq_array_size=None, target_stages=None,
+               first_line=2):
+    """
+    Solve a chunk of csv rows, the first one is on line first_line of the input.
+    Columns named after a variable are inputs, an empty or missing cell gets the default value,
+    a cell that isn't a number raises a ValueError with its line and column.
+    Returns the output rows: the other input columns, passed through, followed by OUTPUT_COLUMNS.
+    """
+    n = len(rows)
+    # Built row by row, so a short row doesn't cut the columns
+    columns = [[row[i] if i < len(row) else '' for row in rows] for i in range(len(header))]
+    variables = {}
+    extra = []
+    for name, column in zip(header, columns):
+        if name not in McCabeThieleBatch.DEFAULTS:
+            extra.append(column)
+        elif name != dependent_variable:
+            values = _parse_column(name, column, first_line)
+            variables[name] = np.where(np.isnan(values), McCabeThieleBatch.DEFAULTS[name], values)
+
+    batch = solve(dependent_variable, max_eq_array_size, stage_method, target_stages=target_stages, **variables)
+    outputs = [*(batch.variables[name] for name in McCabeThieleBatch.DEFAULTS), *batch.q_point]
+    outputs = [np.broadcast_to(output, (n,)).tolist() for output in outputs]
+    n_eq_points = np.broadcast_to(batch.n_eq_points, (n,)).tolist()
+    status = [McCabeThieleBatch.STOP_REASONS[i] for i in np.broadcast_to(batch.stop_reason, (n,))]
+    return [list(row) for row in zip(*extra, *outputs, n_eq_points, status)]
+
+
+def run(infile, outfile, dependent_variable=None, *, chunk_size=10000, n_workers=1,
+        stage_method='stepping', max_eq_array_size=None, target_stages=None):
+    """
+    Stream cases from the csv infile to the csv outfile, chunk_size rows at a time.
+    With more than 1 worker chunks are solved in a process pool, at most 2 per worker are in flight,
+    so memory use doesn't grow with the input. The output keeps the input order and is flushed after every chunk.
+    """
+    dependent_variable = dependent_variable if dependent_variable is not None else McCabeThieleBatch.DEFAULT_DEPENDENT_VAR
+    reader = csv.reader(infile)
+    writer = csv.writer(outfile, lineterminator='\n')
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        raise ValueError("Input has no header. ")
+    writer.writerow([name for name in header if name not in McCabeThieleBatch.DEFAULTS] + list(OUTPUT_COLUMNS))
+
+    def chunks():
+        while True:
+            first_line = reader.line_num + 1
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield chunk, first_line
+
+    args = dependent_variable, stage_method, max_eq_array_size, target_stages
+
+    def write(rows):
+        writer.writerows(rows)
+        outfile.flush()
+
+    if n_workers <= 1:
+        for chunk, first_line in chunks():
+            write(solve_rows(header, chunk, *args, first_line))
+        return
+
+    # Imported here, a worker or a single process run doesn't need it
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(n_workers) as pool:
+        in_flight = deque()
+        for chunk, first_line in chunks():
+            in_flight.append(pool.submit(solve_rows, header, chunk, *args, first_line))
+            if len(in_flight) >= 2 * n_workers:
+                write(in_flight.popleft().result())
+        while in_flight:
+            write(in_flight.popleft().result())
+
+
+def make_parser(prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Solve McCabe Thiele cases from a csv file, one case per row.")
+    parser.add_argument('input', nargs='?', default='-', help="csv file with a header of variable names, - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="csv file for the results, - for stdout")
+    parser.add_argument('-d', '--dependent', default=McCabeThieleBatch.DEFAULT_DEPENDENT_VAR,
+                        choices=McCabeThieleBatch.DEPENDENT_VARS, help="dependent variable")
+    parser.add_argument('-c', '--chunk-size', type=int, default=10000, help="rows solved at once")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="processes, 0 for all cores")
+    parser.add_argument('--stage-method', default='stepping', choices=McCabeThieleBatch.STAGE_METHODS)
+    parser.add_argument('--max-stages', type=int, default=None, help="stage cap of the stepping")
+    parser.add_argument('--target-stages', type=float, default=None, help="stages alpha is solved for, with -d alpha")
+    return parser
+
+
+def main(argv=None, prog=None):
+    """Bad arguments or input end in a usage message and exit status 2, not a traceback."""
+    parser = make_parser(prog)
+    args = parser.parse_args(argv)
+    if 'alpha' == args.dependent and args.target_stages is None:
+        parser.error("-d alpha needs --target-stages")
+    if 'alpha' != args.dependent and args.target_stages is not None:
+        parser.error("--target-stages is only used with -d alpha")
+    n_workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    try:
+        infile = sys.stdin if '-' == args.input else open(args.input, newline='')
+    except OSError as error:
+        parser.error(str(error))
+    try:
+        outfile = sys.stdout if '-' == args.output else open(args.output, 'w', newline='')
+    except OSError as error:
+        if infile is not sys.stdin:
+            infile.close()
+        parser.error(str(error))
+    try:
+        run(infile, outfile, args.dependent, chunk_size=args.chunk_size, n_workers=n_workers,
+            stage_method=args.stage_method, max_eq_array_size=args.max_stages,
+            target_stages=args.target_stages)
+    except ValueError as error:
+        parser.error(str(error).strip())
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch
+from tools import chemistry, roots
+
+# Variable that is solved for -> dependent variable that follows from it, with q and the compositions fixed
+DESIGN_VARIABLES = {'R': 'B', 'B': 'R'}
+DEFAULT_TOLERANCE = 1e-10
+DEFAULT_MAX_ITER = 200
+# How close the fractional stage methods have to get to target
+STAGE_TOLERANCE = 1e-3
+
+
+def _stage_count(batch):
+    """Number of stages of every case, inf where xd isn't reached."""
+    if batch.stage_method in ('smoker', 'shortcut'):
+        stages = batch.n_stages
+    else:
+        stages = batch.n_eq_points.astype(float)
+    reached = McCabeThieleBatch.STOP_REASONS.index('xd') == batch.stop_reason
+    return np.where(reached & ~np.isnan(stages), stages, np.inf)
+
+
+def _minimum(variable, variables, vle_model):
+    """Lower end of the bracket, the pinch at the minimum ratio, or 0 when that isn't known."""
+    if vle_model is not None:
+        return np.zeros(np.shape(variables['xf']))
+    v = variables
+    if 'R' == variable:
+        minimum = chemistry.minimum_reflux(v['xf'], v['xd'], v['alpha'], v['q'])
+    else:
+        minimum = chemistry.minimum_boilup(v['xf'], v['xb'], v['alpha'], v['q'])
+    return np.where(np.isfinite(minimum) & (minimum > 0), minimum, 0.0)
+
+
+def solve_for_stages(target, variable='R', *, stage_method='stepping', vle_model=None, max_eq_array_size=None,
+                     tol=DEFAULT_TOLERANCE, max_iter=DEFAULT_MAX_ITER, **variables):
+    """
+    Smallest reflux ratio R, or boilup ratio B, that gets the column down to target stages, for arrays of targets.
+    The other variables are given like in McCabeThieleBatch.solve, the other ratio is the dependent variable.
+    With more reflux (or boilup) both operating lines move away from the vle curve, so the number of stages
+    only goes down, and bisection between the minimum ratio, where the column pinches,
+    and a ratio that is found by doubling always converges.
+    With the stepping method target is compared with n_eq_points, the answer is where the count drops to target.
+    The smoker and shortcut methods give fractional stages, the answer has target stages, within STAGE_TOLERANCE.
+    Every iteration solves all cases at once in one McCabeThieleBatch, which is built once,
+    together with the vle_model tables, and only gets new ratios.
+    Returns the ratios, nan where target can't be reached (below the minimum number of stages
+    or above max_eq_array_size, which every stage method caps at, or for the fractional methods
+    where the count jumps past target),
+    and the batch solved at the ratios, or at the upper bracket where there is no answer.
+    """
+    if variable not in DESIGN_VARIABLES:
+        raise ValueError(f"Can only solve for {list(DESIGN_VARIABLES)}, not '{variable}'. ")
+    dependent_variable = DESIGN_VARIABLES[variable]
+    if variable in variables or dependent_variable in variables:
+        raise ValueError(f"'{variable}' is solved for and '{dependent_variable}' follows from it, don't give them. ")
+
+    unknown = set(variables) - set(McCabeThieleBatch.DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown variables {sorted(unknown)}. ")
+    kwargs = {var_name.lower(): value for var_name, value in variables.items()}
+    kwargs[variable.lower()] = np.zeros(np.shape(target))
+    batch = McCabeThieleBatch(**kwargs, dependent_variable=dependent_variable, max_eq_array_size=max_eq_array_size,
+                              stage_method=stage_method, vle_model=vle_model)
+    target = np.broadcast_to(np.asarray(target, dtype=float), batch.shape)
+
+    def too_many_stages(ratio):
+        batch.variables[variable] = ratio.copy()
+        batch.make_all_lines()
+        return _stage_count(batch) > target
+
+    low = np.broadcast_to(_minimum(variable, batch.variables, vle_model), batch.shape).astype(float)
+    # Double the upper end until it has few enough stages, targets that are never reached stay open
+    low, high, open_ = roots.expand_bracket(too_many_stages, low, np.maximum(2 * low, 1.0))
+    # Counts above the cap aren't seen, the bisection would stop at the cap instead of at target
+    open_ |= target > batch.max_eq_array_size
+    high = roots.bisect(too_many_stages, low, high, tol, max_iter, skip=open_)
+
+    # The batch ends up solved at the answer
+    too_many_stages(high)
+    if stage_method in ('smoker', 'shortcut'):
+        # The shortcut count jumps to inf at the minimum ratio, and close to it Smoker's count
+        # can need a ratio nearer the pinch than floats resolve, both stop the bisection short of target
+        open_ |= ~(np.abs(_stage_count(batch) - target) <= STAGE_TOLERANCE)
+    return np.where(open_, np.nan, high), batch
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
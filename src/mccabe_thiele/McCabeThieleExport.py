@@ -0,0 +1,102 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
+from src.mccabe_thiele.McCabeThieleView import McCabeThieleView
+
+
+class McCabeThieleExporter:
+    """
+    Draws McCabe Thiele diagrams without a GUI, on an Agg canvas.
+    One figure is built once with McCabeThieleView.init_artists,
+    every case only moves the artists with update_artists and is saved.
+    """
+    FORMATS = ('png', 'svg')
+
+    def __init__(self, figsize=(6, 6), dpi=120):
+        # No pyplot, so no GUI backend and no global figure manager
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        self.view = McCabeThieleView(render_mode='full', threaded=False)
+        self.view.ax = fig.add_subplot()
+        self.view.init_axes()
+        self.view.logic.make_all_lines()
+        self.view.init_artists()
+
+    @property
+    def logic(self):
+        return self.view.logic
+
+    def render(self, case, path):
+        """
+        Solve case, a dict of variables with optionally a 'dependent_variable', and a 'target_stages'
+        when that is alpha, and save the figure to path.
+        """
+        variables = dict(McCabeThieleLogic.DEFAULTS)
+        variables.update({key: float(value) for key, value in case.items() if key in McCabeThieleLogic.DEFAULTS})
+        self.logic.variables.update(variables)
+        self.logic.dependent_variable = case.get('dependent_variable') or McCabeThieleLogic.DEFAULT_DEPENDENT_VAR
+        self.logic.target_stages = float(case['target_stages']) if 'target_stages' in case else None
+        self.logic.make_all_lines()
+        self.view.update_artists()
+        self.view.update_title()
+        self.view.ax.figure.savefig(path)
+        return path
+
+
+def load_cases(path):
+    """
+    Cases from a csv file with a header, columns are variable names, 'dependent_variable', 'target_stages' and 'name'.
+    Empty cells are left out, so they get the default value.
+    """
+    with open(path, newline='') as file:
+        return [{key: value for key, value in row.items() if value not in (None, '')} for row in csv.DictReader(file)]
+
+
+_exporter = None
+
+
+def _init_worker(figsize, dpi):
+    global _exporter
+    _exporter = McCabeThieleExporter(figsize, dpi)
+
+
+def _render(case, path):
+    return _exporter.render(case, path)
+
+
+def export(cases, out_dir, fmt='png', *, n_workers=None, figsize=(6, 6), dpi=120):
+    """
+    Draw every case into out_dir, as {name}.{fmt} or case_{index}.{fmt} for cases without a 'name'.
+    cases is a list of dicts or the path of a csv file, see load_cases.
+    Cases are spread over n_workers processes (all cores by default), each with its own McCabeThieleExporter.
+    Returns the paths of the written files, in the order of cases.
+    """
+    if fmt not in McCabeThieleExporter.FORMATS:
+        raise ValueError(f"Invalid format '{fmt}'. ")
+    if isinstance(cases, (str, os.PathLike)):
+        cases = load_cases(cases)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f"{case.get('name') or f'case_{i:05d}'}.{fmt}") for i, case in enumerate(cases)]
+
+    n_workers = n_workers if n_workers is not None else os.cpu_count() or 1
+    if 1 == n_workers or len(cases) <= 1:
+        exporter = McCabeThieleExporter(figsize, dpi)
+        return [exporter.render(case, path) for case, path in zip(cases, paths)]
+
+    n_workers = min(n_workers, len(cases))
+    chunksize = max(1, len(cases) // (4 * n_workers))
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(figsize, dpi)) as pool:
+        return list(pool.map(_render, cases, paths, chunksize=chunksize))
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
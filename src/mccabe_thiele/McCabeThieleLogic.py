@@ -1,7 +1,11 @@
 
+import math
+
 import numpy as np
 
 from tools import lines, chemistry
+from tools.cache import LRUCache
+from tools.instruments import timed
 
 
 class McCabeThieleLogic:
@@ -15,23 +19,60 @@ class McCabeThieleLogic:
         'B': 10.0,
         'q': 0.99,
     }
+    # Maximum number of stages make_equilibrium_points steps
     DEFAULT_MAX_EQ_ARRAY_SIZE = 127
-    DEPENDENT_VARS = ['R', 'B', 'q', 'xf', 'xd', 'xb']
+    INITIAL_STAGE_BUFFER_SIZE = 32
+    STOP_REASONS = ('xd', 'pinch', 'cap')
+    # For every dependent variable: the operating line that is found, the 2 known lines that give the q-point,
+    # and the steps that solve it in order, variable or line names.
+    # A found line that comes before its variable goes through the q-point.
+    # alpha is found from target_stages, the lines are solved like for q, so q follows as well.
+    DEPENDENT_CASES = {
+        'R': ('rectifying', ('stripping', 'q_line'), ('R', 'rectifying')),
+        'B': ('stripping', ('rectifying', 'q_line'), ('B', 'stripping')),
+        'q': ('q_line', ('rectifying', 'stripping'), ('q', 'q_line')),
+        'xf': ('q_line', ('rectifying', 'stripping'), ('q_line', 'xf')),
+        'xd': ('rectifying', ('stripping', 'q_line'), ('rectifying', 'xd')),
+        'xb': ('stripping', ('rectifying', 'q_line'), ('stripping', 'xb')),
+        'alpha': ('q_line', ('rectifying', 'stripping'), ('q', 'q_line', 'alpha')),
+    }
+    DEPENDENT_VARS = list(DEPENDENT_CASES)
     DEFAULT_DEPENDENT_VAR = 'q'
-
-    def __init__(self, xf=None, xd=None, xb=None, alpha=None, r=None, b=None, q=None, *, max_eq_array_size=None):
+    # Inputs closer together than this share a cache entry
+    CACHE_QUANTUM = 1e-9
+    # Variables each operating line is made from, and the line the dependent variable is found with
+    LINE_VARIABLES = {'rectifying': ('R', 'xd'), 'stripping': ('B', 'xb'), 'q_line': ('q', 'xf')}
+    FOUND_LINES = {dependent_variable: case[0] for dependent_variable, case in DEPENDENT_CASES.items()}
+    STAGES = ('rectifying', 'stripping', 'q_line', 'q_point', 'dependent', 'vle', 'stages')
+
+    def __init__(self, xf=None, xd=None, xb=None, alpha=None, r=None, b=None, q=None, *,
+                 max_eq_array_size=None, cache_size=0, vle_model=None, stage_table=None,
+                 instruments=None, target_stages=None):
         self.variables = {}
         init_args = locals()
 
         for var_name, default_value in self.DEFAULTS.items():
-            value = init_args.get(var_name)
+            value = init_args.get(var_name.lower())
             self.variables[var_name] = value if value is not None else default_value
 
         self._dependent_variable = self.DEFAULT_DEPENDENT_VAR
+        self.cache = LRUCache(cache_size) if cache_size else None
+        # Something like tools.vle.TabulatedVLE, None uses the constant alpha of variables
+        self.vle_model = vle_model
+        # McCabeThieleTable.StageTable that query answers from when it can
+        self.stage_table = stage_table
+        # tools.instruments.Instruments, times every stage of make_all_lines as 'logic.{stage}'
+        self.instruments = instruments
+        # Fractional number of stages, by Smoker's equation, alpha is solved for when it is dependent
+        self.target_stages = target_stages
 
         self.max_eq_array_size = max_eq_array_size if max_eq_array_size is not None else self.DEFAULT_MAX_EQ_ARRAY_SIZE
         self.n_eq_points = 0
-        self.eq_points = np.zeros(( 2 *self.max_eq_array_size, 1), dtype=float)
+        self.n_stages = 0.0
+        self._stage_buffer = np.zeros((self.INITIAL_STAGE_BUFFER_SIZE, 2), dtype=float)
+        self.stages = self._stage_buffer[:1]
+        self.stop_reason = None
+        self.pinch_point = None
 
         self.rectifying_coef = 0.0, 0.0
         self.stripping_coef = 0.0, 0.0
@@ -48,8 +89,26 @@ class McCabeThieleLogic:
             'R': self._calculate_r,
             'B': self._calculate_b,
             'q': self._calculate_q,
+            'alpha': self._calculate_alpha,
+        }
+        self._line_calculators_dict = {
+            'rectifying': self.calc_rectifying_line_coef,
+            'stripping': self.calc_stripping_line_coef,
+            'q_line': self.calc_q_line_coef,
         }
 
+        self._stage_calculators_dict = {
+            **self._line_calculators_dict,
+            'q_point': self.calculate_q_point,
+            'dependent': self.solve_dependent_var,
+            'vle': self.calc_vle_curve,
+            'stages': self.make_equilibrium_points,
+        }
+        # Inputs used by the last make_all_lines, and the stages that must be recomputed regardless
+        self._computed_inputs = {}
+        self.dirty = set(self.STAGES)
+        self.recomputed_stages = ()
+
     @property
     def dependent_variable(self):
         return self._dependent_variable
@@ -58,13 +117,30 @@ class McCabeThieleLogic:
     def dependent_variable(self, new_value):
         if new_value not in self.DEPENDENT_VARS:
             raise ValueError(f"Invalid dependent variable '{new_value}'. ")
+        if new_value != self._dependent_variable:
+            self.dirty.update(self.STAGES)
         self._dependent_variable = new_value
 
+    @classmethod
+    def variables_solved_for(cls, dependent_variable):
+        """Variables make_all_lines finds for dependent_variable, itself and, when that is alpha, q."""
+        return tuple(step for step in cls.DEPENDENT_CASES[dependent_variable][2] if step in cls.DEFAULTS)
+
+    def solved_variables(self):
+        return self.variables_solved_for(self._dependent_variable)
+
+    def through_q_point(self, line):
+        """Whether line is found through the q-point, instead of from its own variables."""
+        found, _, steps = self.DEPENDENT_CASES[self._dependent_variable]
+        return line == found == steps[0]
+
+    def line_coef(self, line):
+        return getattr(self, f'{line}_coef')
 
     def calc_rectifying_line_coef(self):
         r = self.variables['R']
         a = r / (r + 1)
-        if 'xd' == self._dependent_variable:
+        if self.through_q_point('rectifying'):
             b = lines.intersect_from_slope_and_point(a, *self.q_point)
         else:
             xd = self.variables['xd']
@@ -74,7 +150,7 @@ class McCabeThieleLogic:
     def calc_stripping_line_coef(self):
         b = self.variables['B']
         slope = (b + 1) / b
-        if 'xb' == self._dependent_variable:
+        if self.through_q_point('stripping'):
             intercept = lines.intersect_from_slope_and_point(slope, *self.q_point)
         else:
             xb = self.variables['xb']
@@ -88,7 +164,7 @@ class McCabeThieleLogic:
         else:
             slope = q / (q - 1)
 
-        if 'xf' == self.dependent_variable:
+        if self.through_q_point('q_line'):
             intercept = lines.intersect_from_slope_and_point(slope, *self.q_point)
         else:
             xf = self.variables['xf']
@@ -99,35 +175,16 @@ class McCabeThieleLogic:
         self.q_line_coef = slope, intercept
 
     def calc_known_operating_lines(self):
-        match self._dependent_variable:
-            case 'q' | 'xf':
-                self.calc_rectifying_line_coef()
-                self.calc_stripping_line_coef()
-            case 'R' | 'xd':
-                self.calc_stripping_line_coef()
-                self.calc_q_line_coef()
-            case 'B' | 'xb':
-                self.calc_rectifying_line_coef()
-                self.calc_q_line_coef()
+        for line in self.DEPENDENT_CASES[self._dependent_variable][1]:
+            self._line_calculators_dict[line]()
 
     def calculate_q_point(self):
+        first, second = self.DEPENDENT_CASES[self._dependent_variable][1]
         xf = self.variables['xf']
-        q = self.variables['q']
-        match self._dependent_variable:
-            case 'q' | 'xf':
-                ans = lines.intersect(*self.rectifying_coef, *self.stripping_coef)
-            case 'R' | 'xd':
-                if q == 1:
-                    ans = xf, lines.get_y(xf, *self.stripping_coef)
-                else:
-                    ans = lines.intersect(*self.stripping_coef, *self.q_line_coef)
-            case 'B' | 'xb':
-                if q == 1:
-                    ans = xf, lines.get_y(xf, *self.rectifying_coef)
-                else:
-                    ans = lines.intersect(*self.rectifying_coef, *self.q_line_coef)
-            case _:
-                raise ValueError("Impossible to get here")
+        if 'q_line' == second and 1 == self.variables['q']:
+            ans = xf, lines.get_y(xf, *self.line_coef(first))
+        else:
+            ans = lines.intersect(*self.line_coef(first), *self.line_coef(second))
         self.q_point = ans
 
     def _calculate_q(self):
@@ -163,6 +220,10 @@ class McCabeThieleLogic:
 
     def _calculate_x(self, var, coef):
         a, b = coef
+        if float('inf') == a:
+            # Vertical line, the intercept is its x
+            self.variables[var] = b
+            return
         if 1 == a:
             raise ValueError("This should be physically impossible.")
         self.variables[var] = b / (1 - a)
@@ -176,61 +237,303 @@ class McCabeThieleLogic:
     def _calculate_xd(self):
         self._calculate_x('xd', self.rectifying_coef)
 
-    def calculate_dependent_var(self):
-        self._variable_calculators_dict[self._dependent_variable]()
+    def _calculate_alpha(self):
+        self._require_constant_alpha()
+        if self.target_stages is None:
+            raise ValueError("alpha can only be dependent with target_stages. ")
+        self.variables['alpha'] = float(chemistry.alpha_for_stages(
+            self.target_stages, self.variables['xb'], self.variables['xd'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1]))
 
-    def calc_found_operating_line(self):
-        match self._dependent_variable:
-            case 'q' | 'xf':
-                self.calc_q_line_coef()
-            case 'R' | 'xd':
-                self.calc_rectifying_line_coef()
-            case 'B' | 'xb':
-                self.calc_stripping_line_coef()
+    def _grow_stage_buffer(self):
+        old = self._stage_buffer
+        self._stage_buffer = np.empty((2 * len(old), 2), dtype=float)
+        self._stage_buffer[:len(old)] = old
+
+    def find_pinch(self):
+        """
+        Checks analytically if an operating line touches the vle curve between xb and xd.
+        Sets pinch_point to that point on the vle curve, or None, and returns whether there is a pinch.
+        """
+        x = chemistry.column_pinch_composition(
+            self.variables['xb'], self.variables['xd'], self.variables['alpha'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1], self.vle_model)
+        if np.isnan(x):
+            self.pinch_point = None
+        else:
+            self.pinch_point = float(x), float(self.vle(float(x)))
+        return self.pinch_point is not None
+
+    def solve_dependent_var(self):
+        for step in self.DEPENDENT_CASES[self._dependent_variable][2]:
+            if step in self._line_calculators_dict:
+                self._line_calculators_dict[step]()
+            else:
+                self._variable_calculators_dict[step]()
+
+    def vle(self, x):
+        """y in equilibrium with x, from vle_model or the constant alpha."""
+        if self.vle_model is not None:
+            return self.vle_model(x)
+        return chemistry.vapor_liquid_equilibrium(x, self.variables['alpha'])
+
+    def _require_constant_alpha(self):
+        if self.vle_model is not None:
+            raise ValueError("Only possible for a constant alpha, not with a vle_model. ")
+
+    def calc_vle_curve(self):
+        self.vle_curve = self.vle(self.xs)
 
     def make_equilibrium_points(self):
         """
-        TODO: The constant reshaping of this array isn't necessary anymore,
-        But it will be a lot of work to refactor, for very little benefit.
+        Steps from xb up to xd, taking the stripping or rectifying line, whichever is further right.
+        Row i of stages is the point (x, y) on the operating line after i steps, row 0 is (xb, xb).
+        The rows are written into one buffer that is reused between calls, and doubled when it is full.
+        Stops when xd is reached, when a step doesn't get any further (pinch),
+        or after max_eq_array_size steps (cap), stop_reason tells which.
+        When find_pinch finds a pinch no steps are taken at all.
         """
-        n_eq_points = 0
-        eqs = self.eq_points
-        eqs.shape = (2 * self.max_eq_array_size, 1)
-        eqs.fill(0.0)
         xb = self.variables['xb']
         xd = self.variables['xd']
         alpha = self.variables['alpha']
-        n = 3
-        eqs[:n] = xb
-
-        while eqs[n - 1] < xd and n < 2 * self.max_eq_array_size - 5:
-            new = chemistry.vapor_liquid_equilibrium(eqs[n - 1], alpha)
-
-            strip = (new - self.stripping_coef[1]) / self.stripping_coef[0]
-            rect = (new - self.rectifying_coef[1]) / self.rectifying_coef[0]
+        vle_model = self.vle_model
+        strip_a, strip_b = self.stripping_coef
+        rect_a, rect_b = self.rectifying_coef
+
+        self._stage_buffer[0] = xb, xb
+        if self.find_pinch():
+            self.stages = self._stage_buffer[:1]
+            self.n_eq_points = 0
+            self.stop_reason = 'pinch'
+            return
+
+        # numpy scalar, so a zero slope gives inf instead of raising
+        x = np.float64(xb)
+        n_eq_points = 0
+        while True:
+            if not x < xd:
+                stop_reason = 'xd'
+                break
+            if n_eq_points >= self.max_eq_array_size:
+                stop_reason = 'cap'
+                break
+            if vle_model is None:
+                y = chemistry.vapor_liquid_equilibrium(x, alpha)
+            else:
+                y = vle_model(x)
+            new_x = max((y - strip_b) / strip_a, (y - rect_b) / rect_a)
+            if not new_x > x:
+                stop_reason = 'pinch'
+                break
 
-            eqs[n] = new
-            eqs[n + 1] = max(strip, rect)
-            eqs[n + 2] = eqs[n]
-            eqs[n + 3] = eqs[n + 1]
-            n += 4
             n_eq_points += 1
+            if n_eq_points == len(self._stage_buffer):
+                self._grow_stage_buffer()
+            self._stage_buffer[n_eq_points] = new_x, y
+            x = new_x
 
-        self.eq_points.shape = (self.max_eq_array_size, 2)
+        self.stages = self._stage_buffer[:n_eq_points + 1]
         self.n_eq_points = n_eq_points
+        self.stop_reason = stop_reason
+        if self.instruments is not None:
+            self.instruments.count('logic.stage_loop_iterations', n_eq_points)
+
+    def staircase(self):
+        """The (2 * n_eq_points + 1, 2) points of the staircase, as drawn in the diagram."""
+        stages = self.stages
+        points = np.empty((2 * len(stages) - 1, 2), dtype=float)
+        points[0::2] = stages
+        points[1::2, 0] = stages[:-1, 0]
+        points[1::2, 1] = stages[1:, 1]
+        return points
+
+    def stage_temperatures(self):
+        """
+        Temperature of every stage from the bottom up, the bubble point of the liquid leaving it.
+        Needs a vle_model with temperatures, like tools.vle.RaoultVLE.
+        """
+        if not hasattr(self.vle_model, 'temperature'):
+            raise ValueError("Stage temperatures need a vle_model with a temperature method. ")
+        return self.vle_model.temperature(self.stages[:-1, 0])
+
+    def calc_stages_smoker(self):
+        """
+        Closed form alternative to make_equilibrium_points, with Smoker's equation.
+        Only gives the stage count, stages isn't touched.
+        Sets n_stages to the fractional number of stages and returns the number of steps
+        make_equilibrium_points takes, without the max_eq_array_size cap.
+        """
+        self._require_constant_alpha()
+        steps, stages = chemistry.smoker_column_stages(
+            self.variables['xb'], self.variables['xd'], self.variables['alpha'],
+            self.rectifying_coef, self.stripping_coef, self.q_point[1])
+        self.n_stages = float(stages)
+        return float(steps)
+
+    def calc_minimum_reflux(self):
+        """Minimum reflux ratio for the current xf, xd, alpha and q."""
+        self._require_constant_alpha()
+        v = self.variables
+        return float(chemistry.minimum_reflux(v['xf'], v['xd'], v['alpha'], v['q']))
+
+    def calc_minimum_boilup(self):
+        """Minimum boilup ratio for the current xf, xb, alpha and q."""
+        self._require_constant_alpha()
+        v = self.variables
+        return float(chemistry.minimum_boilup(v['xf'], v['xb'], v['alpha'], v['q']))
+
+    def calc_minimum_stages(self):
+        """Fractional number of stages at total reflux."""
+        self._require_constant_alpha()
+        v = self.variables
+        return float(chemistry.minimum_stages(v['xd'], v['xb'], v['alpha']))
+
+    def calc_feed_stage(self):
+        """
+        First stage below the rectifying section, counted from the top,
+        like McCabeThieleBatch.feed_stage and chemistry.shortcut_design.
+        """
+        return int(np.count_nonzero(self.stages[1:, 1] > self.q_point[1])) + 1
+
+    def calc_shortcut(self):
+        """
+        Fenske-Underwood-Gilliland shortcut design for the current variables, see chemistry.shortcut_design.
+        Returns a dict with 'n_min', 'r_min', 'n_stages' and 'feed_stage'.
+        """
+        self._require_constant_alpha()
+        v = self.variables
+        design = chemistry.shortcut_design(v['xf'], v['xd'], v['xb'], v['alpha'], v['q'], v['R'])
+        return {name: float(value) for name, value in zip(('n_min', 'r_min', 'n_stages', 'feed_stage'), design)}
+
+    def _cache_key(self):
+        solved = self.solved_variables()
+        quantized = tuple(
+            round(value / self.CACHE_QUANTUM) if math.isfinite(value) else value
+            for var_name, value in self.variables.items() if var_name not in solved)
+        target_stages = self.target_stages if 'alpha' in solved else None
+        return self._dependent_variable, self.max_eq_array_size, self.vle_model, target_stages, quantized
+
+    def get_state(self):
+        """Everything make_all_lines produces, set_state puts it back."""
+        return {
+            'dependent_variable': self._dependent_variable,
+            'dependent_value': self.variables[self._dependent_variable],
+            'solved_values': {var_name: self.variables[var_name] for var_name in self.solved_variables()},
+            'rectifying_coef': self.rectifying_coef,
+            'stripping_coef': self.stripping_coef,
+            'q_line_coef': self.q_line_coef,
+            'q_point': self.q_point,
+            'vle_curve': self.vle_curve,
+            # The stage buffer is reused, so the cache needs its own copy
+            'stages': self.stages.copy(),
+            'n_eq_points': self.n_eq_points,
+            'stop_reason': self.stop_reason,
+            'pinch_point': self.pinch_point,
+        }
+
+    def set_state(self, state):
+        self.dependent_variable = state['dependent_variable']
+        self.variables.update(state['solved_values'])
+        self.rectifying_coef = state['rectifying_coef']
+        self.stripping_coef = state['stripping_coef']
+        self.q_line_coef = state['q_line_coef']
+        self.q_point = state['q_point']
+        self.vle_curve = state['vle_curve']
+        self.stages = state['stages']
+        self.n_eq_points = state['n_eq_points']
+        self.stop_reason = state['stop_reason']
+        self.pinch_point = state['pinch_point']
+
+    def cache_info(self):
+        """Hits, misses and size of the make_all_lines cache, None when caching is off."""
+        return self.cache.info() if self.cache is not None else None
 
     def make_all_lines(self):
-        self.calc_known_operating_lines()
-        self.calculate_q_point()
-        # The order of the next 2 steps depend on what is calculated
-        if self.dependent_variable in ('R', 'B', 'q'):
-            self.calculate_dependent_var()
-            self.calc_found_operating_line()
+        """
+        With a cache_size, results are kept in an LRU cache keyed on the independent variables,
+        quantized to CACHE_QUANTUM, and the dependent variable.
+        """
+        timed(self.instruments, 'logic.make_all_lines', self._make_all_lines_cached)
+
+    def _make_all_lines_cached(self):
+        if self.cache is None:
+            self._make_all_lines()
+            return
+        key = self._cache_key()
+        state = self.cache.get(key)
+        if self.instruments is not None:
+            self.instruments.count('logic.cache_misses' if state is None else 'logic.cache_hits')
+        if state is None:
+            self._make_all_lines()
+            self.cache.put(key, self.get_state())
+        else:
+            self.set_state(state)
+            self._computed_inputs = self._current_inputs()
+            self.dirty = set()
+            self.recomputed_stages = ()
+
+    def query(self, max_error=None):
+        """
+        Number of stages and dependent variable value for the current variables, without stepping when possible.
+        Returns (n_eq_points, dependent_value, errors): interpolated from stage_table with the error bounds
+        of StageTable.lookup, or solved with make_all_lines, errors None, when the table doesn't cover the variables,
+        has no answer there, or an error bound is above max_error.
+        n_eq_points is a float when interpolated.
+        """
+        table = self.stage_table
+        if (table is not None and self.vle_model is None and table.max_eq_array_size == self.max_eq_array_size
+                and table.covers(self.variables, self._dependent_variable)):
+            values, errors = table.lookup(**{dim: self.variables[dim] for dim in table.dims})
+            if all(error <= (max_error if max_error is not None else math.inf) for error in errors.values()):
+                return values['n_eq_points'], values['dependent_value'], errors
+        self.make_all_lines()
+        return self.n_eq_points, self.variables[self._dependent_variable], None
+
+    def dependency_graph(self):
+        """
+        Inputs of every stage of make_all_lines for the current dependent variable, in the order they are computed.
+        Inputs are variable names, 'max_eq_array_size', 'vle_model', 'target_stages' or other stages.
+        """
+        found = self.FOUND_LINES[self._dependent_variable]
+        known = [line for line in self.LINE_VARIABLES if line != found]
+        graph = {line: set(self.LINE_VARIABLES[line]) for line in known}
+        graph['q_point'] = set(known)
+        graph['dependent'] = {'q_point', *self.LINE_VARIABLES[found]} - set(self.solved_variables())
+        if 'alpha' == self._dependent_variable:
+            graph['dependent'] |= {'xb', 'xd', 'vle_model', 'target_stages'}
+            graph['vle'] = {'dependent', 'vle_model'}
         else:
-            self.calc_found_operating_line()
-            self.calculate_dependent_var()
-        self.vle_curve = chemistry.vapor_liquid_equilibrium(self.xs, self.variables['alpha'])
-        self.make_equilibrium_points()
+            graph['vle'] = {'alpha', 'vle_model'}
+        graph['stages'] = {'dependent', *known, 'alpha', 'vle_model', 'xb', 'xd', 'max_eq_array_size'}
+        return graph
+
+    def _current_inputs(self):
+        solved = self.solved_variables()
+        inputs = {var_name: value for var_name, value in self.variables.items() if var_name not in solved}
+        inputs['max_eq_array_size'] = self.max_eq_array_size
+        inputs['vle_model'] = self.vle_model
+        inputs['target_stages'] = self.target_stages
+        return inputs
+
+    def _make_all_lines(self):
+        """
+        Only recomputes the stages that are dirty, or whose inputs changed since the last call.
+        A recomputed stage makes every stage that uses it dirty, following dependency_graph.
+        """
+        inputs = self._current_inputs()
+        dirty = self.dirty | {name for name, value in inputs.items() if self._computed_inputs.get(name) != value}
+        recomputed = []
+        for stage, stage_inputs in self.dependency_graph().items():
+            if stage in dirty or stage_inputs & dirty:
+                if self.instruments is None:
+                    self._stage_calculators_dict[stage]()
+                else:
+                    self.instruments.time(f'logic.{stage}', self._stage_calculators_dict[stage])
+                dirty.add(stage)
+                recomputed.append(stage)
+        self._computed_inputs = inputs
+        self.dirty = set()
+        self.recomputed_stages = tuple(recomputed)
 
 
 def main():
@@ -0,0 +1,192 @@
+import numbers
+import os
+import sys
+from collections import deque
+
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch, solve
+from tools.stats import StreamingStats
+
+DEFAULT_N_BINS = 2048
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class MonteCarloResult:
+    """
+    Statistics of a Monte Carlo run, merged chunk by chunk.
+    stages holds the number of stages of the cases that reach xd, as integers,
+    dependent the finite values of the dependent variable.
+    """
+
+    def __init__(self, dependent_variable, stages, dependent):
+        self.dependent_variable = dependent_variable
+        self.n_samples = 0
+        self.n_pinch = 0
+        self.n_cap = 0
+        self.stages = stages
+        self.dependent = dependent
+
+    def empty_copy(self):
+        return MonteCarloResult(self.dependent_variable, self.stages.empty_copy(), self.dependent.empty_copy())
+
+    def update(self, batch):
+        stop_reason = batch.stop_reason.ravel()
+        reached = McCabeThieleBatch.STOP_REASONS.index('xd') == stop_reason
+        self.n_samples += stop_reason.size
+        self.n_pinch += int(np.count_nonzero(McCabeThieleBatch.STOP_REASONS.index('pinch') == stop_reason))
+        self.n_cap += int(np.count_nonzero(McCabeThieleBatch.STOP_REASONS.index('cap') == stop_reason))
+        self.stages.update(batch.n_eq_points.ravel()[reached])
+        self.dependent.update(batch.variables[self.dependent_variable])
+
+    def merge(self, other):
+        self.n_samples += other.n_samples
+        self.n_pinch += other.n_pinch
+        self.n_cap += other.n_cap
+        self.stages.merge(other.stages)
+        self.dependent.merge(other.dependent)
+
+    @property
+    def p_pinch(self):
+        return self.n_pinch / self.n_samples if self.n_samples else np.nan
+
+    @property
+    def p_cap(self):
+        return self.n_cap / self.n_samples if self.n_samples else np.nan
+
+    def stage_histogram(self):
+        """Number of cases that reach xd with every stage count, index is the count."""
+        return self.stages.histogram
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        return {
+            'n_samples': self.n_samples,
+            'p_pinch': self.p_pinch,
+            'p_cap': self.p_cap,
+            'stages': self.stages.summary(quantiles),
+            self.dependent_variable: self.dependent.summary(quantiles),
+        }
+
+
+def sample(distributions, size, rng):
+    """
+    Draw size values of every variable.
+    A distribution is a number, numpy scalars included, for a fixed value, or a tuple of the name of a numpy Generator method
+    and its parameters, like ('normal', 1.85, 0.05) or ('uniform', 0.9, 1.1).
+    Variables are drawn in the order of McCabeThieleBatch.DEFAULTS, so a seed always gives the same samples.
+    """
+    variables = {}
+    for var_name in McCabeThieleBatch.DEFAULTS:
+        if var_name not in distributions:
+            continue
+        distribution = distributions[var_name]
+        if isinstance(distribution, numbers.Real):
+            variables[var_name] = distribution
+        else:
+            name, *parameters = distribution
+            variables[var_name] = getattr(rng, name)(*parameters, size=size)
+    return variables
+
+
+def _check_distributions(distributions, dependent_variable):
+    for var_name, distribution in distributions.items():
+        if var_name not in McCabeThieleBatch.DEFAULTS:
+            raise ValueError(f"Unknown variable '{var_name}'. ")
+        if var_name in McCabeThieleBatch.variables_solved_for(dependent_variable):
+            raise ValueError(f"'{var_name}' is solved for with dependent variable '{dependent_variable}', "
+                             f"it can't be given a distribution. ")
+        if isinstance(distribution, numbers.Real):
+            continue
+        if not distribution or not isinstance(distribution[0], str) or not hasattr(np.random.Generator, distribution[0]):
+            raise ValueError(f"Invalid distribution {distribution!r} for '{var_name}'. ")
+
+
+def _run_chunk(distributions, seed, size, dependent_variable, stage_method, max_eq_array_size, target_stages, empty):
+    rng = np.random.default_rng(seed)
+    batch = solve(dependent_variable, max_eq_array_size, stage_method, target_stages=target_stages,
+                  **sample(distributions, size, rng))
+    result = empty.empty_copy()
+    result.update(batch)
+    return result
+
+
+def monte_carlo(distributions, n_samples, dependent_variable=None, *, seed=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                n_workers=None, stage_method='stepping', max_eq_array_size=None, dependent_range=None,
+                n_bins=DEFAULT_N_BINS, target_stages=None, progress=None):
+    """
+    Propagate the distributions of the variables, see sample, through the batch solver.
+    Variables without a distribution get their default value.
+    The n_samples cases are drawn and solved chunk_size at a time and only the statistics are kept,
+    so memory doesn't grow with n_samples. Every chunk gets its own seed, spawned from seed,
+    and the chunks are merged in order, so the result only depends on seed and chunk_size, not on n_workers.
+    Chunks are solved on n_workers processes, all cores by default, with at most 2 chunks per worker in flight.
+    The histogram of the dependent variable spans dependent_range, by default the range of the first chunk
+    widened by half on both sides, values outside it only count for min, max, mean and std.
+    progress is called as progress(n_done, n_samples) after every chunk, like McCabeThieleSweep.print_progress.
+    target_stages is only used, and needed, when alpha is the dependent variable, q is then solved as well.
+    """
+    dependent_variable = dependent_variable if dependent_variable is not None else McCabeThieleBatch.DEFAULT_DEPENDENT_VAR
+    _check_distributions(distributions, dependent_variable)
+    if n_samples < 1:
+        raise ValueError(f"Need at least 1 sample, not {n_samples}. ")
+    max_eq_array_size = max_eq_array_size if max_eq_array_size is not None else McCabeThieleBatch.DEFAULT_MAX_EQ_ARRAY_SIZE
+
+    sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = dependent_variable, stage_method, max_eq_array_size, target_stages
+
+    if dependent_range is None:
+        # The first chunk sets the histogram edges, so it is drawn twice, once here
+        rng = np.random.default_rng(seeds[0])
+        values = solve(dependent_variable, max_eq_array_size, stage_method, target_stages=target_stages,
+                       **sample(distributions, sizes[0], rng)).variables[dependent_variable]
+        values = values[np.isfinite(values)]
+        low, high = (float(np.min(values)), float(np.max(values))) if values.size else (0.0, 1.0)
+        dependent_range = low - 0.5 * (high - low), high + 0.5 * (high - low)
+        if dependent_range[0] == dependent_range[1]:
+            dependent_range = dependent_range[0] - 0.5, dependent_range[1] + 0.5
+    empty = MonteCarloResult(dependent_variable, StreamingStats.integers(max_eq_array_size),
+                             StreamingStats(np.linspace(*dependent_range, n_bins + 1)))
+
+    result = empty.empty_copy()
+    n_done = 0
+
+    def merge(chunk):
+        nonlocal n_done
+        result.merge(chunk)
+        n_done += chunk.n_samples
+        if progress is not None:
+            progress(n_done, n_samples)
+
+    n_workers = n_workers if n_workers is not None else os.cpu_count() or 1
+    if 1 == n_workers or len(sizes) <= 1:
+        for chunk_seed, size in zip(seeds, sizes):
+            merge(_run_chunk(distributions, chunk_seed, size, *args, empty))
+        return result
+
+    # Imported here, like in McCabeThieleSweep
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(n_workers) as pool:
+        in_flight = deque()
+        for chunk_seed, size in zip(seeds, sizes):
+            in_flight.append(pool.submit(_run_chunk, distributions, chunk_seed, size, *args, empty))
+            if len(in_flight) >= 2 * n_workers:
+                merge(in_flight.popleft().result())
+        while in_flight:
+            merge(in_flight.popleft().result())
+    return result
+
+
+def print_progress(n_done, n_total):
+    print(f"\rMonte Carlo: {n_done}/{n_total} samples ({100 * n_done / n_total:.0f}%)",
+          end='\n' if n_done == n_total else '', file=sys.stderr)
+
+
+def main():
+    result = monte_carlo({'alpha': ('normal', 1.85, 0.05), 'q': ('normal', 0.99, 0.03)}, 10 ** 6, 'B',
+                         seed=0, progress=print_progress)
+    print(result.summary())
+
+
+if __name__ == "__main__":
+    main()
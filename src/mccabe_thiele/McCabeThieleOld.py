@@ -4,7 +4,7 @@ import numpy as np
 from matplotlib.widgets import Button, RadioButtons
 
 from tools import lines
-from tools.CustomSlider import CustomSlider
+from src.mccabe_thiele.CustomSlider import CustomSlider
 from tools.chemistry import vapor_liquid_equilibrium
 
 
@@ -0,0 +1,107 @@
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch
+
+DEFAULT_RELATIVE_STEP = 1e-6
+
+
+class SensitivityResult:
+    """
+    Derivatives of the dependent variable and of the fractional number of stages
+    with respect to every independent variable, for every case.
+    d_dependent and d_stages map a variable name to an array of the shape of the cases.
+    """
+
+    def __init__(self, dependent_variable, variables, dependent_value, n_stages, d_dependent, d_stages):
+        self.dependent_variable = dependent_variable
+        self.variables = variables
+        self.dependent_value = dependent_value
+        self.n_stages = n_stages
+        self.d_dependent = d_dependent
+        self.d_stages = d_stages
+
+    def elasticities(self, values):
+        """
+        Relative sensitivities of the number of stages, d ln(N) / d ln(v),
+        values are the independent variables of the cases, like the variables given to sensitivity.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {var_name: self.d_stages[var_name] * values[var_name] / self.n_stages for var_name in self.variables}
+
+    def ranking(self, values):
+        """Variable names of a single case, the one with the largest effect on the number of stages first."""
+        elasticities = self.elasticities(values)
+        return sorted(self.variables, key=lambda var_name: -np.nan_to_num(abs(float(elasticities[var_name])), nan=-1.0))
+
+
+def sensitivity(dependent_variable=None, *, relative_step=DEFAULT_RELATIVE_STEP, stage_method=None,
+                vle_model=None, max_eq_array_size=None, target_stages=None, **variables):
+    """
+    Central difference derivatives of the dependent variable and the number of stages for one case or a batch.
+    variables are given like in McCabeThieleBatch.solve, the independent ones are each moved up and down
+    by relative_step times their size (at least relative_step). All the moved cases and the case itself
+    are solved in one McCabeThieleBatch, with the moves on an extra last axis.
+    stage_method is smoker by default, or stepping with a vle_model, both give fractional stages.
+    alpha isn't an input with a vle_model and gets no derivative.
+    With alpha as the dependent variable it is found for target_stages, q is solved as well and gets no derivative.
+    """
+    dependent_variable = dependent_variable if dependent_variable is not None else McCabeThieleBatch.DEFAULT_DEPENDENT_VAR
+    stage_method = stage_method if stage_method is not None else 'smoker' if vle_model is None else 'stepping'
+    unknown = set(variables) - set(McCabeThieleBatch.DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown variables {sorted(unknown)}. ")
+    solved = McCabeThieleBatch.variables_solved_for(dependent_variable)
+    for var_name in solved:
+        if var_name in variables:
+            raise ValueError(f"'{var_name}' is solved for with dependent variable '{dependent_variable}', "
+                             f"it can't be given a value. ")
+
+    independent = [var_name for var_name in McCabeThieleBatch.DEFAULTS
+                   if var_name not in solved and not ('alpha' == var_name and vle_model is not None)]
+    values = {var_name: np.asarray(variables.get(var_name, default), dtype=float)
+              for var_name, default in McCabeThieleBatch.DEFAULTS.items() if var_name not in solved}
+    shape = np.broadcast_shapes(*(value.shape for value in values.values()))
+    n_moves = 2 * len(independent) + 1
+
+    # Move k of variable i is 2 * i + 1 (up) and 2 * i + 2 (down), move 0 is the case itself
+    moved = {var_name: np.repeat(np.broadcast_to(value, shape)[..., None], n_moves, axis=-1)
+             for var_name, value in values.items()}
+    steps = {}
+    for i, var_name in enumerate(independent):
+        step = relative_step * np.maximum(np.abs(np.broadcast_to(values[var_name], shape)), 1.0)
+        moved[var_name][..., 2 * i + 1] += step
+        moved[var_name][..., 2 * i + 2] -= step
+        steps[var_name] = step
+
+    kwargs = {var_name.lower(): value for var_name, value in moved.items()}
+    batch = McCabeThieleBatch(**kwargs, dependent_variable=dependent_variable, max_eq_array_size=max_eq_array_size,
+                              stage_method=stage_method, vle_model=vle_model,
+                              target_stages=target_stages).make_all_lines()
+    dependent = batch.variables[dependent_variable]
+    stages = batch.n_stages
+
+    d_dependent = {}
+    d_stages = {}
+    with np.errstate(invalid='ignore'):
+        for i, var_name in enumerate(independent):
+            up, down = 2 * i + 1, 2 * i + 2
+            d_dependent[var_name] = (dependent[..., up] - dependent[..., down]) / (2 * steps[var_name])
+            d_stages[var_name] = (stages[..., up] - stages[..., down]) / (2 * steps[var_name])
+    return SensitivityResult(dependent_variable, tuple(independent), dependent[..., 0], stages[..., 0],
+                             d_dependent, d_stages)
+
+
+def format_sensitivity(result):
+    """Table of a single case, d(dependent)/dv and dN/dv for every independent variable v."""
+    rows = [f"{'':6s}{'d' + result.dependent_variable:>9s}{'dN':>9s}"]
+    for var_name in result.variables:
+        rows.append(f"{var_name:6s}{float(result.d_dependent[var_name]):9.3g}{float(result.d_stages[var_name]):9.3g}")
+    return '\n'.join(rows)
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import sys
+
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch, solve
+
+
+class SweepResult:
+    """
+    Result of a sweep over a grid.
+    Every array has one dimension per axis, in the order of dims, coords holds the values along each axis.
+    """
+
+    def __init__(self, coords, dependent_variable, n_eq_points, dependent_values, stop_reason):
+        self.coords = coords
+        self.dims = tuple(coords)
+        self.dependent_variable = dependent_variable
+        self.n_eq_points = n_eq_points
+        self.dependent_values = dependent_values
+        self.stop_reason = stop_reason
+
+    @property
+    def shape(self):
+        return self.n_eq_points.shape
+
+    def sel(self, **values):
+        """
+        Sub result at the grid points closest to the given axis values,
+        the selected axes are dropped like indexing with an int.
+        """
+        index = []
+        coords = {}
+        for dim, axis in self.coords.items():
+            if dim in values:
+                index.append(int(np.argmin(np.abs(axis - values[dim]))))
+            else:
+                index.append(slice(None))
+                coords[dim] = axis
+        index = tuple(index)
+        return SweepResult(coords, self.dependent_variable, self.n_eq_points[index],
+                           self.dependent_values[index], self.stop_reason[index])
+
+
+def print_progress(n_done, n_total):
+    print(f"\rSweep: {n_done}/{n_total} cases ({100 * n_done / n_total:.0f}%)",
+          end='\n' if n_done == n_total else '', file=sys.stderr)
+
+
+def _solve_chunk(coords, fixed, dependent_variable, max_eq_array_size, stage_method, target_stages, start, stop):
+    shape = tuple(len(axis) for axis in coords.values())
+    index = np.unravel_index(np.arange(start, stop), shape)
+    variables = dict(fixed)
+    for (dim, axis), i in zip(coords.items(), index):
+        variables[dim] = axis[i]
+    batch = solve(dependent_variable, max_eq_array_size, stage_method, target_stages=target_stages, **variables)
+    return start, batch.n_eq_points, batch.variables[dependent_variable], batch.stop_reason
+
+
+def sweep(axes, dependent_variable=None, fixed=None, *, n_workers=None, chunk_size=65536,
+          max_eq_array_size=None, stage_method='stepping', target_stages=None, progress=None):
+    """
+    Solve every point of the grid spanned by axes, a dict of variable name -> 1d values.
+    Variables that aren't an axis come from fixed, or McCabeThieleLogic.DEFAULTS.
+    The grid is cut into chunks of chunk_size cases which are solved with McCabeThieleBatch
+    on n_workers processes (all cores by default, 1 solves in this process).
+    Each chunk lands on its own place in the result, so the output doesn't depend on the number of workers.
+    target_stages is only used, and needed, when alpha is the dependent variable, q is then solved as well.
+    progress is called as progress(n_done, n_total) after every chunk, see print_progress.
+    """
+    dependent_variable = dependent_variable if dependent_variable is not None else McCabeThieleBatch.DEFAULT_DEPENDENT_VAR
+    fixed = dict(fixed) if fixed is not None else {}
+    coords = {dim: np.atleast_1d(np.asarray(axis, dtype=float)) for dim, axis in axes.items()}
+
+    if not coords:
+        raise ValueError("At least one axis is required. ")
+    for dim in (*coords, *fixed):
+        if dim not in McCabeThieleBatch.DEFAULTS:
+            raise ValueError(f"Unknown variable '{dim}'. ")
+    for var_name in McCabeThieleBatch.variables_solved_for(dependent_variable):
+        if var_name in coords or var_name in fixed:
+            raise ValueError(f"'{var_name}' is solved for with dependent variable '{dependent_variable}', "
+                             f"it can't be given a value. ")
+    both = set(coords) & set(fixed)
+    if both:
+        raise ValueError(f"Variables {sorted(both)} are both an axis and fixed. ")
+
+    shape = tuple(len(axis) for axis in coords.values())
+    n_total = int(np.prod(shape))
+    n_eq_points = np.zeros(n_total, dtype=int)
+    dependent_values = np.zeros(n_total, dtype=float)
+    stop_reason = np.zeros(n_total, dtype=np.int8)
+
+    def store(chunk):
+        start, chunk_n_eq_points, chunk_dependent_values, chunk_stop_reason = chunk
+        stop = start + len(chunk_n_eq_points)
+        n_eq_points[start:stop] = chunk_n_eq_points
+        dependent_values[start:stop] = chunk_dependent_values
+        stop_reason[start:stop] = chunk_stop_reason
+        return stop - start
+
+    args = coords, fixed, dependent_variable, max_eq_array_size, stage_method, target_stages
+    starts = range(0, n_total, chunk_size)
+    n_workers = n_workers if n_workers is not None else os.cpu_count() or 1
+    n_done = 0
+    if 1 == n_workers or len(starts) <= 1:
+        for start in starts:
+            n_done += store(_solve_chunk(*args, start, min(start + chunk_size, n_total)))
+            if progress is not None:
+                progress(n_done, n_total)
+    else:
+        # Imported here, a worker or a single process sweep doesn't need it
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(min(n_workers, len(starts))) as pool:
+            futures = [pool.submit(_solve_chunk, *args, start, min(start + chunk_size, n_total)) for start in starts]
+            for future in as_completed(futures):
+                n_done += store(future.result())
+                if progress is not None:
+                    progress(n_done, n_total)
+
+    return SweepResult(coords, dependent_variable, n_eq_points.reshape(shape),
+                       dependent_values.reshape(shape), stop_reason.reshape(shape))
+
+
+def main():
+    result = sweep({'R': np.linspace(0.5, 6.0, 56), 'alpha': np.linspace(1.2, 5.0, 39), 'q': np.linspace(0.0, 1.5, 16)},
+                   'B', chunk_size=4096, progress=print_progress)
+    print(result.dims, result.shape)
+    print(result.sel(q=1.0, alpha=2.0).n_eq_points)
+
+
+if __name__ == "__main__":
+    main()
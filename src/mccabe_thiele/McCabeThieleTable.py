@@ -0,0 +1,142 @@
+import json
+import os
+
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch
+from src.mccabe_thiele.McCabeThieleSweep import sweep
+
+
+class StageTable:
+    """
+    Number of stages and dependent variable value on a grid of some of the variables, the others fixed.
+    Built once with McCabeThieleSweep.sweep and stored in 2 files, {path}.npy with the values, which is
+    memory-mapped when loaded so only the pages a lookup touches are read, and {path}.json describing the grid.
+    Lookups interpolate multilinearly, with an error bound from the spread of the values on the cell corners.
+    The bound holds when the values are monotone within a cell, which is the case away from pinches.
+    Cases that don't reach xd are stored as nan, so a cell touching one has no answer.
+    """
+    OUTPUTS = ('n_eq_points', 'dependent_value')
+    # Fixed variables closer than this to the table value are the same
+    FIXED_TOLERANCE = 1e-12
+
+    def __init__(self, coords, dependent_variable, fixed, max_eq_array_size, data):
+        self.coords = coords
+        self.dims = tuple(coords)
+        self.dependent_variable = dependent_variable
+        self.fixed = fixed
+        self.max_eq_array_size = max_eq_array_size
+        self.data = data
+
+    @property
+    def shape(self):
+        return self.data.shape[:-1]
+
+    @staticmethod
+    def _paths(path):
+        path = os.fspath(path)
+        return path + '.npy', path + '.json'
+
+    @classmethod
+    def build(cls, path, axes, dependent_variable=None, fixed=None, *, max_eq_array_size=None, **sweep_kwargs):
+        """
+        Sweep the grid spanned by axes, see McCabeThieleSweep.sweep which also gets sweep_kwargs,
+        write the table to path and return it loaded from there.
+        Every axis needs at least 2 increasing values.
+        alpha can't be the dependent variable, the table has no target_stages to look it up by.
+        """
+        dependent_variable = dependent_variable if dependent_variable is not None else McCabeThieleBatch.DEFAULT_DEPENDENT_VAR
+        if 'alpha' == dependent_variable:
+            raise ValueError("A stage table can't have alpha as the dependent variable. ")
+        max_eq_array_size = max_eq_array_size if max_eq_array_size is not None else McCabeThieleBatch.DEFAULT_MAX_EQ_ARRAY_SIZE
+        for dim, axis in axes.items():
+            axis = np.asarray(axis, dtype=float)
+            if axis.ndim != 1 or len(axis) < 2 or np.any(np.diff(axis) <= 0):
+                raise ValueError(f"Axis '{dim}' needs at least 2 increasing values. ")
+        result = sweep(axes, dependent_variable, fixed, max_eq_array_size=max_eq_array_size, **sweep_kwargs)
+
+        data_path, info_path = cls._paths(path)
+        data = np.lib.format.open_memmap(data_path, mode='w+', dtype=float, shape=(*result.shape, len(cls.OUTPUTS)))
+        reached = McCabeThieleBatch.STOP_REASONS.index('xd') == result.stop_reason
+        data[..., 0] = np.where(reached, result.n_eq_points, np.nan)
+        data[..., 1] = np.where(reached, result.dependent_values, np.nan)
+        data.flush()
+        del data
+
+        fixed = dict(fixed) if fixed is not None else {}
+        all_fixed = {var_name: float(fixed.get(var_name, default)) for var_name, default in McCabeThieleBatch.DEFAULTS.items()
+                     if var_name not in result.coords and var_name != dependent_variable}
+        info = {
+            'coords': {dim: axis.tolist() for dim, axis in result.coords.items()},
+            'dependent_variable': dependent_variable,
+            'fixed': all_fixed,
+            'max_eq_array_size': max_eq_array_size,
+        }
+        with open(info_path, 'w') as file:
+            json.dump(info, file, indent=1)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        data_path, info_path = cls._paths(path)
+        with open(info_path) as file:
+            info = json.load(file)
+        coords = {dim: np.array(axis, dtype=float) for dim, axis in info['coords'].items()}
+        data = np.load(data_path, mmap_mode='r')
+        return cls(coords, info['dependent_variable'], info['fixed'], info['max_eq_array_size'], data)
+
+    def covers(self, variables, dependent_variable):
+        """Whether variables, a dict like McCabeThieleLogic.variables, are for this table and inside its grid."""
+        if dependent_variable != self.dependent_variable:
+            return False
+        for var_name, value in self.fixed.items():
+            if not abs(variables[var_name] - value) <= self.FIXED_TOLERANCE:
+                return False
+        return all(axis[0] <= variables[dim] <= axis[-1] for dim, axis in self.coords.items())
+
+    def lookup(self, **values):
+        """
+        Interpolated outputs at the given axis values, which are broadcast against each other.
+        Returns 2 dicts keyed on OUTPUTS, the values and their error bounds, nan where the table has no answer.
+        Values outside the grid are clipped to it, check with covers first.
+        """
+        missing = set(self.dims) - set(values)
+        if missing:
+            raise ValueError(f"Missing axis values {sorted(missing)}. ")
+        points = np.broadcast_arrays(*(np.asarray(values[dim], dtype=float) for dim in self.dims))
+        index = []
+        fraction = []
+        for axis, point in zip(self.coords.values(), points):
+            i = np.clip(np.searchsorted(axis, point, side='right') - 1, 0, len(axis) - 2)
+            index.append(i)
+            fraction.append(np.clip((point - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0))
+
+        shape = points[0].shape + (len(self.OUTPUTS),)
+        value = np.zeros(shape)
+        low = np.full(shape, np.inf)
+        high = np.full(shape, -np.inf)
+        # The 2 ** n_dims corners of the cell around every point
+        for corner in np.ndindex(*(2,) * len(self.dims)):
+            weight = np.ones(points[0].shape)
+            for side, f in zip(corner, fraction):
+                weight = weight * (f if side else 1 - f)
+            corner_value = self.data[tuple(i + side for i, side in zip(index, corner))]
+            value += weight[..., None] * corner_value
+            low = np.fmin(low, corner_value)
+            high = np.fmax(high, corner_value)
+        # A nan corner makes the value nan through the sum, the error must follow
+        error = np.where(np.isnan(value), np.nan, high - low)
+
+        if not points[0].shape:
+            return ({name: float(value[k]) for k, name in enumerate(self.OUTPUTS)},
+                    {name: float(error[k]) for k, name in enumerate(self.OUTPUTS)})
+        return ({name: value[..., k] for k, name in enumerate(self.OUTPUTS)},
+                {name: error[..., k] for k, name in enumerate(self.OUTPUTS)})
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,139 @@
 
+import threading
+import time
+from collections import deque
+
 from matplotlib import pyplot as plt
 from matplotlib.widgets import Button, RadioButtons
 
 from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
-from tools.CustomSlider import CustomSlider
+from src.mccabe_thiele.McCabeThieleSensitivity import format_sensitivity, sensitivity
+from src.mccabe_thiele.CustomSlider import CustomSlider
+from tools.instruments import timed
+
+
+class UpdateCoalescer:
+    """
+    Collapses a burst of requests into one call of callback, on the next tick of a single shot canvas timer.
+    Requests made while callback runs are caused by the callback itself, and are dropped too.
+    """
+
+    def __init__(self, canvas, callback, interval):
+        self.callback = callback
+        self.timer = canvas.new_timer(interval=interval)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.flush)
+
+        self.pending = False
+        self.running = False
+        self.n_processed = 0
+        self.n_dropped = 0
+
+    def request(self, *args):
+        if self.running or self.pending:
+            self.n_dropped += 1
+            return
+        self.pending = True
+        self.timer.start()
+
+    def flush(self):
+        """Call callback now if a request is pending, the timer does this on its own."""
+        if not self.pending:
+            return
+        self.pending = False
+        self.running = True
+        try:
+            self.callback()
+        finally:
+            self.running = False
+        self.n_processed += 1
+
+    def report(self):
+        return f"{self.n_processed} updates processed, {self.n_dropped} events dropped"
+
+
+class BackgroundSolver:
+    """
+    Runs make_all_lines on a daemon worker thread, with its own McCabeThieleLogic.
+    Only the latest request is kept, a newer submit replaces a request that hasn't started yet.
+    Every request gets a generation number, a finished result is only kept if it is newer than the one waiting.
+    """
+
+    def __init__(self, logic):
+        self.logic = logic
+        self._condition = threading.Condition()
+        self._request = None
+        self._result = None
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, name="McCabeThieleSolver", daemon=True)
+        self._thread.start()
+
+    def submit(self, variables, dependent_variable):
+        with self._condition:
+            self._generation += 1
+            self._request = self._generation, dict(variables), dependent_variable
+            self._condition.notify()
+            return self._generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                generation, variables, dependent_variable = self._request
+                self._request = None
+
+            self.logic.variables.update(variables)
+            self.logic.dependent_variable = dependent_variable
+            try:
+                self.logic.make_all_lines()
+            except Exception as error:
+                result = generation, variables, None, error
+            else:
+                result = generation, dict(self.logic.variables), self.logic.get_state(), None
+
+            with self._condition:
+                if self._result is None or self._result[0] < generation:
+                    self._result = result
+
+    def take_result(self):
+        """The newest finished (generation, variables, state, error), or None."""
+        with self._condition:
+            result, self._result = self._result, None
+            return result
 
 
 class McCabeThieleView:
     N_OF_SLIDERS = 7
-
-    def __init__(self):
-        self.logic = McCabeThieleLogic()
+    CACHE_SIZE = 512
+    RENDER_MODES = ('full', 'blit')
+    N_FRAME_TIMES = 200
+    # One solve per frame at most
+    FRAME_INTERVAL_MS = 16
+
+    def __init__(self, render_mode='blit', threaded=True, vle_model=None, instruments=None, sensitivity_panel=False):
+        if render_mode not in self.RENDER_MODES:
+            raise ValueError(f"Invalid render mode '{render_mode}'. ")
+        # tools.instruments.Instruments, shared with the logic, times the update phases as 'view.{phase}'
+        self.instruments = instruments
+        self.logic = McCabeThieleLogic(cache_size=self.CACHE_SIZE, vle_model=vle_model, instruments=instruments)
+        self.render_mode = render_mode
+        self.threaded = threaded
+        # Derivatives of the dependent variable and the stages, in the corner of the diagram
+        self.sensitivity_panel = sensitivity_panel
+        self.solver = None
+        self.poll_timer = None
+        self.shown_generation = 0
 
         self.ax = None
         self.artists = None
         self.sliders = None
         self.reset_button = None
         self.radio_buttons = None
+        self.coalescer = None
+
+        self.background = None
+        self.frame_times = deque(maxlen=self.N_FRAME_TIMES)
 
     @property
     def dependent_variable(self):
@@ -36,8 +153,7 @@ class McCabeThieleView:
         xf = self.logic.variables['xf']
         xd = self.logic.variables['xd']
         q_point = self.logic.q_point
-        eq_points = self.logic.eq_points
-        n_eq_points = self.logic.n_eq_points
+        eq_points = self.logic.staircase()
         xs = self.logic.xs
         vle_curve = self.logic.vle_curve
 
@@ -49,12 +165,16 @@ class McCabeThieleView:
             'strip': ax.plot([xd, q_point[0]], [xd, q_point[1]])[0],
             'q_line': ax.plot([xf, q_point[0]], [xf, q_point[1]])[0],
             'vle': ax.plot(xs, vle_curve)[0],
-            'eq_points': ax.plot(eq_points[:n_eq_points * 2 + 1, 0], eq_points[:n_eq_points * 2 + 1, 1])[0],
+            'eq_points': ax.plot(eq_points[:, 0], eq_points[:, 1])[0],
             # Text Artists
             'feed_text': ax.text(xf, xf, "Feed", ha='left', va='top', fontsize=12),
             'bottoms_text': ax.text(xb, xb, "Bottom", ha='left', va='top', fontsize=12),
             'distillate_text': ax.text(xd, xd, "Distillate", ha='left', va='top', fontsize=12)
         }
+        if self.sensitivity_panel:
+            self.artists['sensitivity'] = ax.text(
+                0.98, 0.02, "", transform=ax.transAxes, ha='right', va='bottom', family='monospace', fontsize=8)
+            self.update_sensitivity()
 
     def update_artists(self):
         # Getting values from the logic class.
@@ -62,8 +182,7 @@ class McCabeThieleView:
         xf = self.logic.variables['xf']
         xd = self.logic.variables['xd']
         q_point = self.logic.q_point
-        eq_points = self.logic.eq_points
-        n_eq_points = self.logic.n_eq_points
+        eq_points = self.logic.staircase()
         vle_curve = self.logic.vle_curve
 
         # Update Operating Lines
@@ -73,7 +192,7 @@ class McCabeThieleView:
         # Update VLE curve
         self.artists['vle'].set_ydata(vle_curve)
         # Update Equilibrium Steps
-        self.artists['eq_points'].set_data(eq_points[:n_eq_points * 2 + 1, 0], eq_points[:n_eq_points * 2 + 1, 1])
+        self.artists['eq_points'].set_data(eq_points[:, 0], eq_points[:, 1])
         # Update Text Positions
         self.artists['feed_text'].set_position((xf, xf))
         self.artists['bottoms_text'].set_position((xb, xb))
@@ -91,7 +210,7 @@ class McCabeThieleView:
             for ax, variable, valmin, valmax in zip(axes, variables, minimums, maximums)}
 
         for slider in self.sliders.values():
-            slider.on_changed(self.update_all)
+            slider.on_changed(self.coalescer.request)
 
     def init_button(self):
         reset_ax = plt.axes((0.1, 0.05, 0.15, 0.05))
@@ -101,19 +220,16 @@ class McCabeThieleView:
     def on_radio_button_press(self, label):
         self.dependent_variable = label
         print(label)
-        self.ax.figure.canvas.draw()
+        self.redraw()
 
     def init_radio_button(self):
-        """
-        TODO: This 3 needs to be the same as the default value in the logic class
-        for dependent variable.
-        But it will some work to refactor.
-        """
+        """alpha isn't on it, it needs a target number of stages instead of a slider."""
         radio_ax = plt.axes((0.04, 0.16, 0.05, 0.7))
         radio_ax.set_axis_off()
         labels = ('xb', 'xf', 'xd', 'q', 'R', 'B')
         radio_props = {'s': 64}
-        self.radio_buttons = RadioButtons(radio_ax, labels, active=3, radio_props=radio_props)
+        self.radio_buttons = RadioButtons(radio_ax, labels, active=labels.index(self.logic.dependent_variable),
+                                          radio_props=radio_props)
         self.radio_buttons.on_clicked(self.on_radio_button_press)
 
         for text in self.radio_buttons.labels:
@@ -124,13 +240,32 @@ class McCabeThieleView:
         fig, ax = plt.subplots(figsize=(8, 5), dpi=120)
         fig.suptitle(f"Interactive McCabe Thiele Graph")
         plt.subplots_adjust(left=0.4)
-
-        ax.set_xlim(0., 1.)
-        ax.set_ylim(0., 1.)
-        ax.grid(True)
         self.ax = ax
-
-    def update_all(self, val):
+        self.init_axes()
+
+    def init_axes(self):
+        self.ax.set_xlim(0., 1.)
+        self.ax.set_ylim(0., 1.)
+        self.ax.grid(True)
+
+    def init_coalescer(self):
+        canvas = self.ax.figure.canvas
+        self.coalescer = UpdateCoalescer(canvas, self.update_all, self.FRAME_INTERVAL_MS)
+
+    def init_solver(self):
+        """The worker solves, a repeating timer picks up its results on the GUI thread."""
+        if not self.threaded:
+            return
+        self.solver = BackgroundSolver(McCabeThieleLogic(
+            cache_size=self.CACHE_SIZE, vle_model=self.logic.vle_model, instruments=self.instruments))
+        self.poll_timer = self.ax.figure.canvas.new_timer(interval=self.FRAME_INTERVAL_MS)
+        self.poll_timer.add_callback(self.poll_solver)
+        self.poll_timer.start()
+
+    def update_all(self, val=None):
+        timed(self.instruments, 'view.update_all', self._update_all)
+
+    def _update_all(self):
         for key, slider in self.sliders.items():
             if key in self.logic.variables:
                 self.logic.variables[key] = slider.val
@@ -146,32 +281,142 @@ class McCabeThieleView:
         if xf >= xd:
             self.logic.variables['xd'] = xf + 0.01
 
+        if self.solver is not None:
+            self.solver.submit(self.logic.variables, self.dependent_variable)
+            # The sliders don't draw themselves, so they are shown now, the diagram keeps the last result until
+            # poll_solver gets the new one
+            timed(self.instruments, 'view.redraw', self.redraw)
+            return
         self.logic.make_all_lines()
-        self.update_artists()
-
+        self.show_results()
+
+    def poll_solver(self):
+        result = self.solver.take_result()
+        if result is None:
+            return
+        generation, variables, state, error = result
+        # A result for an older request, or from before the dependent variable changed, is stale
+        if generation <= self.shown_generation or state is not None and state['dependent_variable'] != self.dependent_variable:
+            return
+        self.shown_generation = generation
+        if error is not None:
+            raise error
+        self.logic.variables.update(variables)
+        self.logic.set_state(state)
+        self.show_results()
+
+    def show_results(self):
+        timed(self.instruments, 'view.update_artists', self.update_artists)
+        timed(self.instruments, 'view.update_sliders', self.update_dependent_slider)
+        timed(self.instruments, 'view.update_title', self.update_title)
+        if self.sensitivity_panel:
+            timed(self.instruments, 'view.update_sensitivity', self.update_sensitivity)
+        timed(self.instruments, 'view.redraw', self.redraw)
+
+    def update_dependent_slider(self):
         dv = self.dependent_variable
         self.sliders[dv].set_val(self.logic.variables[dv])
         self.sliders[dv].set_val_text(self.logic.variables[dv])
-        self.ax.set_title(f"Number of equilibrium stages: {self.logic.n_eq_points}")
 
+    def update_sensitivity(self):
+        """Fills the sensitivity panel for the current variables, all derivatives come from one batch solve."""
+        dv = self.dependent_variable
+        variables = {var_name: value for var_name, value in self.logic.variables.items() if var_name != dv}
+        result = sensitivity(dv, vle_model=self.logic.vle_model, max_eq_array_size=self.logic.max_eq_array_size,
+                             **variables)
+        self.artists['sensitivity'].set_text(format_sensitivity(result))
+
+    def update_title(self):
+        if self.logic.pinch_point is not None:
+            self.ax.set_title(f"Pinch at x = {self.logic.pinch_point[0]:.3f}, infeasible")
+        else:
+            self.ax.set_title(f"Number of equilibrium stages: {self.logic.n_eq_points}")
+
+    def dynamic_artists(self):
+        """Everything that changes when a slider moves, the rest of the figure is the static background."""
+        artists = [artist for name, artist in self.artists.items() if name != 'diagonal']
+        artists.append(self.ax.title)
+        for slider in self.sliders.values():
+            # _handle is the circle on the slider bar
+            artists.extend((slider.poly, slider._handle, slider.custom_valtext))
+        return artists
+
+    def init_render_mode(self):
+        """
+        The sliders stop drawing themselves, redraw does it for the whole figure.
+        In blit mode the dynamic artists are animated, so they are left out of a full draw,
+        and the background is stored on every full draw, like in src/Separation/ternary.py.
+        """
+        for slider in self.sliders.values():
+            slider.drawon = False
+        canvas = self.ax.figure.canvas
+        if 'blit' == self.render_mode and getattr(canvas, 'supports_blit', False):
+            for artist in self.dynamic_artists():
+                artist.set_animated(True)
+            canvas.mpl_connect('draw_event', self.on_draw)
+        else:
+            self.render_mode = 'full'
+
+    def on_draw(self, event):
+        fig = self.ax.figure
+        self.background = fig.canvas.copy_from_bbox(fig.bbox)
+        self.draw_dynamic_artists()
+
+    def draw_dynamic_artists(self):
+        fig = self.ax.figure
+        for artist in self.dynamic_artists():
+            fig.draw_artist(artist)
+
+    def redraw(self):
+        """Blit the dynamic artists over the stored background, or draw the whole figure, and time it."""
+        start = time.perf_counter()
+        canvas = self.ax.figure.canvas
+        if 'blit' == self.render_mode and self.background is not None:
+            canvas.restore_region(self.background)
+            self.draw_dynamic_artists()
+            canvas.blit(self.ax.figure.bbox)
+        else:
+            canvas.draw()
+        self.frame_times.append(time.perf_counter() - start)
+
+    def frame_time_report(self):
+        if not self.frame_times:
+            return f"No frames drawn ({self.render_mode})"
+        times = [1000 * frame_time for frame_time in self.frame_times]
+        return (f"{len(times)} frames ({self.render_mode}): "
+                f"mean {sum(times) / len(times):.2f} ms, max {max(times):.2f} ms")
 
     def reset_sliders(self, event):
         for slider in self.sliders.values():
             slider.reset()
 
-    def main(self):
+    def init_figure(self):
+        """Everything main does before showing the figure, also usable with a non interactive backend."""
         self.construct_figure()
+        self.init_coalescer()
 
         self.logic.make_all_lines()
-        self.ax.set_title(f"Number of equilibrium stages: {self.logic.n_eq_points}")
+        self.update_title()
         self.init_artists()
         self.init_sliders()
         self.init_radio_button()
 
         self.sliders[self.dependent_variable].disable()
+        if self.logic.vle_model is not None:
+            # alpha isn't used with measured vle data
+            self.sliders['alpha'].disable()
         self.init_button()
+        self.init_render_mode()
+        self.init_solver()
 
+    def main(self):
+        """Shows the figure, the frame times, coalescer counts and timers are only printed with instruments."""
+        self.init_figure()
         plt.show()
+        if self.instruments is not None:
+            print(self.frame_time_report())
+            print(self.coalescer.report())
+            print(self.instruments.summary())
 
 
 def main():
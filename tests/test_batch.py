@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from src.mccabe_thiele.McCabeThieleBatch import McCabeThieleBatch, solve
+from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
+
+pytestmark = pytest.mark.filterwarnings('ignore::RuntimeWarning')
+
+TARGET_STAGES = 9.0
+
+
+def random_cases(n, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        'xf': rng.uniform(0.35, 0.65, n),
+        'xd': rng.uniform(0.7, 0.99, n),
+        'xb': rng.uniform(0.01, 0.3, n),
+        'alpha': rng.uniform(1.2, 6, n),
+        'R': rng.uniform(0.3, 8, n),
+        'B': rng.uniform(0.5, 15, n),
+        'q': rng.choice([1.0, 0.5, 1.2, 0.0, -0.5], n),
+    }
+
+
+def physical(variables):
+    v = variables
+    return (v['R'] > 0) & (v['B'] > 0) & (0 < v['xb']) & (v['xb'] < v['xf']) & (v['xf'] < v['xd']) & (v['xd'] < 1)
+
+
+@pytest.mark.parametrize('dependent_variable', McCabeThieleLogic.DEPENDENT_VARS)
+def test_batch_matches_logic_exactly(dependent_variable):
+    cases = random_cases(200, 0)
+    batch = solve(dependent_variable, target_stages=TARGET_STAGES, **cases)
+    for i in range(200):
+        logic = McCabeThieleLogic(**{var_name.lower(): float(value[i]) for var_name, value in cases.items()},
+                                  target_stages=TARGET_STAGES)
+        logic.dependent_variable = dependent_variable
+        try:
+            logic.make_all_lines()
+        except (ValueError, ZeroDivisionError, TypeError):
+            # The logic class raises where the batch gives nan or inf
+            continue
+        expected = [logic.variables[var_name] for var_name in logic.solved_variables()]
+        expected += [*logic.q_point, *logic.rectifying_coef, *logic.stripping_coef, *logic.q_line_coef]
+        actual = [batch.variables[var_name][i] for var_name in logic.solved_variables()]
+        actual += [*(coef[i] for coef in (*batch.q_point, *batch.rectifying_coef,
+                                          *batch.stripping_coef, *batch.q_line_coef))]
+        np.testing.assert_array_equal(np.array(actual, dtype=float), np.array(expected, dtype=float))
+        assert batch.n_eq_points[i] == logic.n_eq_points
+        assert McCabeThieleBatch.STOP_REASONS[batch.stop_reason[i]] == logic.stop_reason
+
+
+@pytest.mark.parametrize('dependent_variable', ['q', 'R', 'B', 'xf', 'xd', 'xb'])
+def test_smoker_matches_stepping(dependent_variable):
+    batch = solve(dependent_variable, max_eq_array_size=2000, **random_cases(20000, 1))
+    mismatch = batch.cross_check_stages()
+    assert not (mismatch & physical(batch.variables)).any()
+
+
+@pytest.mark.parametrize('stage_method', McCabeThieleBatch.STAGE_METHODS)
+def test_cross_check_leaves_the_batch_alone(stage_method):
+    batch = solve('B', stage_method=stage_method, keep_stages=True, **random_cases(500, 2))
+    before = {name: getattr(batch, name) for name in McCabeThieleBatch.STAGE_OUTPUTS}
+    batch.cross_check_stages()
+    for name, value in before.items():
+        np.testing.assert_array_equal(getattr(batch, name), value)
+
+
+@pytest.mark.parametrize('stage_method', McCabeThieleBatch.STAGE_METHODS)
+def test_compare_shortcut_leaves_the_batch_alone(stage_method):
+    batch = solve('B', stage_method=stage_method, keep_stages=True, **random_cases(500, 2))
+    before = {name: getattr(batch, name) for name in McCabeThieleBatch.STAGE_OUTPUTS}
+    batch.compare_shortcut()
+    for name, value in before.items():
+        np.testing.assert_array_equal(getattr(batch, name), value)
+
+
+def test_alpha_gives_target_stages():
+    batch = solve('alpha', stage_method='smoker', target_stages=[8.0, 12.0, 20.0], R=[2.0, 3.0, 4.0])
+    np.testing.assert_allclose(batch.n_stages, [8.0, 12.0, 20.0], atol=1e-6)
+    assert batch.solved_variables() == ('q', 'alpha')
@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+from src.mccabe_thiele.McCabeThieleCli import main, run
+
+
+def solve_csv(text, *args, **kwargs):
+    outfile = io.StringIO()
+    run(io.StringIO(text), outfile, *args, **kwargs)
+    return outfile.getvalue().splitlines()
+
+
+def test_short_rows_keep_the_other_columns():
+    rows = solve_csv("id,xf,R,alpha\na,0.5,3,2.5\nb,0.4,2\nc,0.45,4,3.0\n")
+    header = rows[0].split(',')
+    alphas = [row.split(',')[header.index('alpha')] for row in rows[1:]]
+    assert ['2.5', '1.85', '3.0'] == alphas
+
+
+def test_bad_cell_names_line_and_column():
+    with pytest.raises(ValueError, match="Line 3: 'abc' in column 'R'"):
+        solve_csv("xf,R\n0.5,3\n0.4,abc\n")
+
+
+@pytest.mark.parametrize('argv', [['-d', 'alpha'], ['--target-stages', '5'], ['missing.csv']])
+def test_bad_arguments_exit_with_usage(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert 2 == exit_info.value.code
+    assert 'error:' in capsys.readouterr().err
+
+
+def test_bad_input_exits_with_usage(tmp_path, capsys):
+    path = tmp_path / 'cases.csv'
+    path.write_text("xf,R\n0.5,abc\n")
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(path), '-o', str(tmp_path / 'out.csv')])
+    assert 2 == exit_info.value.code
+    assert "'abc' in column 'R'" in capsys.readouterr().err
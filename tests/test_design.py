@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from src.mccabe_thiele.McCabeThieleDesign import STAGE_TOLERANCE, solve_for_stages
+
+pytestmark = pytest.mark.filterwarnings('ignore::RuntimeWarning')
+
+
+@pytest.mark.parametrize('variable', ['R', 'B'])
+@pytest.mark.parametrize('stage_method', ['smoker', 'shortcut'])
+def test_fractional_methods_hit_target(variable, stage_method):
+    target = np.array([12.5, 20.0, 30.0])
+    ratio, batch = solve_for_stages(target, variable, stage_method=stage_method)
+    assert np.isfinite(ratio).all()
+    np.testing.assert_allclose(batch.n_stages, target, atol=STAGE_TOLERANCE)
+
+
+def test_stepping_drops_to_target():
+    ratio, batch = solve_for_stages(np.array([10.0, 40.0]), 'R')
+    np.testing.assert_array_equal(batch.n_eq_points, [10, 40])
+
+
+def test_shortcut_target_past_the_jump_has_no_answer():
+    # Eduljee's Gilliland form stays below 4 * Nmin + 3, about 40.5 here, until the minimum reflux ratio
+    ratio, _ = solve_for_stages([45.0], 'R', stage_method='shortcut')
+    assert np.isnan(ratio).all()
+
+
+def test_target_above_the_cap_has_no_answer():
+    ratio, _ = solve_for_stages([200.0], 'R', max_eq_array_size=127)
+    assert np.isnan(ratio).all()
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from src.mccabe_thiele.McCabeThieleMonteCarlo import monte_carlo
+from src.mccabe_thiele.McCabeThieleSensitivity import sensitivity
+from src.mccabe_thiele.McCabeThieleSweep import sweep
+from src.mccabe_thiele.McCabeThieleTable import StageTable
+
+pytestmark = pytest.mark.filterwarnings('ignore::RuntimeWarning')
+
+
+def test_sweep_solves_alpha_for_target_stages():
+    result = sweep({'R': [2.0, 3.0, 4.0]}, 'alpha', target_stages=12.0, n_workers=1)
+    np.testing.assert_array_equal(result.n_eq_points, [12, 12, 12])
+    with pytest.raises(ValueError, match="'q' is solved for"):
+        sweep({'q': [0.5, 1.0]}, 'alpha', target_stages=12.0, n_workers=1)
+
+
+def test_sensitivity_of_alpha_leaves_q_out():
+    result = sensitivity('alpha', target_stages=12.0)
+    assert 'q' not in result.variables
+    assert abs(float(result.d_stages['R'])) < 1e-2
+
+
+def test_monte_carlo_of_alpha():
+    result = monte_carlo({'R': ('normal', 3.0, 0.1)}, 1000, 'alpha', target_stages=12.0, seed=0, n_workers=1)
+    assert 1000 == result.dependent.n
+    with pytest.raises(ValueError, match="'q' is solved for"):
+        monte_carlo({'q': ('normal', 1.0, 0.1)}, 10, 'alpha', target_stages=12.0)
+
+
+def test_stage_table_rejects_alpha(tmp_path):
+    with pytest.raises(ValueError):
+        StageTable.build(tmp_path / 'table', {'R': [2.0, 3.0]}, 'alpha')
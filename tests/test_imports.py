@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.bench import COMPUTE_MODULES, imported_modules
+
+
+@pytest.mark.parametrize('module', COMPUTE_MODULES)
+def test_compute_module_does_not_load_matplotlib(module):
+    assert 'matplotlib' not in imported_modules(module)
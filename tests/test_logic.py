@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from src.mccabe_thiele.McCabeThieleLogic import McCabeThieleLogic
+
+pytestmark = pytest.mark.filterwarnings('ignore::RuntimeWarning')
+
+RANGES = {'xf': (0.35, 0.65), 'xd': (0.7, 0.99), 'xb': (0.01, 0.3), 'alpha': (1.2, 5),
+          'R': (0.5, 6), 'B': (0.5, 15), 'q': (-0.5, 1.5)}
+
+
+def state(logic):
+    return [*(logic.variables[var_name] for var_name in logic.solved_variables()), *logic.rectifying_coef,
+            *logic.stripping_coef, *logic.q_line_coef, *logic.q_point, logic.n_eq_points]
+
+
+@pytest.mark.parametrize('cache_size', [0, 64])
+def test_incremental_recompute_matches_full(cache_size):
+    rng = np.random.default_rng(3)
+    incremental = McCabeThieleLogic(cache_size=cache_size, target_stages=9.0)
+    for _ in range(1000):
+        if rng.random() < 0.05:
+            incremental.dependent_variable = str(rng.choice(McCabeThieleLogic.DEPENDENT_VARS))
+        if rng.random() < 0.05:
+            incremental.target_stages = float(rng.integers(5, 15))
+        for _ in range(rng.integers(1, 3)):
+            var_name = str(rng.choice(list(RANGES)))
+            if var_name not in incremental.solved_variables():
+                # Rounded, so the cache gets hits
+                incremental.variables[var_name] = round(float(rng.uniform(*RANGES[var_name])), 1)
+        try:
+            incremental.make_all_lines()
+        except (ValueError, ZeroDivisionError, TypeError):
+            incremental.dirty.update(incremental.STAGES)
+            continue
+
+        full = McCabeThieleLogic(target_stages=incremental.target_stages)
+        full.variables = dict(incremental.variables)
+        full.dependent_variable = incremental.dependent_variable
+        full.make_all_lines()
+        np.testing.assert_array_equal(np.array(state(incremental), dtype=float), np.array(state(full), dtype=float))
+        assert incremental.stop_reason == full.stop_reason
+        np.testing.assert_array_equal(incremental.staircase(), full.staircase())
+        np.testing.assert_array_equal(incremental.vle_curve, full.vle_curve)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from src.mccabe_thiele.McCabeThieleMonteCarlo import monte_carlo
+
+DISTRIBUTIONS = {'alpha': ('normal', 1.85, 0.05), 'q': ('normal', 0.99, 0.03), 'xf': 0.6}
+
+
+def test_result_does_not_depend_on_workers():
+    results = [monte_carlo(DISTRIBUTIONS, 20000, 'B', seed=3, chunk_size=3000, n_workers=n_workers)
+               for n_workers in (1, 2)]
+    for stats in ('stages', 'dependent'):
+        one, two = (getattr(result, stats) for result in results)
+        assert (one.n, one.mean, one.m2, one.min, one.max) == (two.n, two.mean, two.m2, two.min, two.max)
+        np.testing.assert_array_equal(one.histogram, two.histogram)
+    assert (results[0].n_pinch, results[0].n_cap) == (results[1].n_pinch, results[1].n_cap)
+
+
+def test_numpy_scalars_are_fixed_values():
+    fixed = monte_carlo({'xf': np.float64(0.6), 'R': np.int64(3)}, 100, 'B', seed=0, n_workers=1)
+    plain = monte_carlo({'xf': 0.6, 'R': 3}, 100, 'B', seed=0, n_workers=1)
+    assert fixed.dependent.mean == plain.dependent.mean
@@ -0,0 +1,35 @@
+import matplotlib
+
+matplotlib.use('Agg')
+
+import pytest
+from matplotlib import pyplot as plt
+
+from src.mccabe_thiele.McCabeThieleView import McCabeThieleView
+from tools.instruments import Instruments
+
+
+def test_threaded_update_redraws_the_sliders_before_the_result():
+    view = McCabeThieleView(threaded=True)
+    view.init_figure()
+    try:
+        submitted = []
+        redraws = []
+        # A solve that never finishes
+        view.solver.submit = lambda variables, dependent_variable: submitted.append(dict(variables))
+        view.redraw = lambda: redraws.append(view.sliders['R'].val)
+        view.sliders['R'].set_val(4.0)
+        view.update_all()
+        assert 4.0 == submitted[-1]['R']
+        assert [4.0] == redraws
+    finally:
+        plt.close(view.ax.figure)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_main_only_reports_with_instruments(capsys):
+    for instruments, reports in ((None, False), (Instruments(), True)):
+        view = McCabeThieleView(threaded=False, instruments=instruments)
+        view.main()
+        plt.close(view.ax.figure)
+        assert bool(capsys.readouterr().out) == reports
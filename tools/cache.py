@@ -0,0 +1,43 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded mapping that forgets the least recently used entry when it is full.
+    Counts hits and misses of get.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError(f"Cache size must be at least 1, not {maxsize}. ")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize, 'currsize': len(self._data)}
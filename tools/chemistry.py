@@ -1,5 +1,7 @@
 import numpy as np
 
+from tools import roots
+
 
 def vapor_liquid_equilibrium(x: float | np.ndarray, alpha: float):
     """Vapor Liquid Equilibrium Curve"""
@@ -8,3 +10,233 @@ def vapor_liquid_equilibrium(x: float | np.ndarray, alpha: float):
 
 def vapor_liquid_equilibrium_inverse(y: float | np.ndarray, alpha: float):
     return y / (alpha - y * (alpha - 1))
+
+
+def _smoker_constants(slope: float | np.ndarray, intercept: float | np.ndarray, alpha: float | np.ndarray,
+                      x_start: float | np.ndarray, x_end: float | np.ndarray):
+    """
+    One step of the staircase, x -> (vle(x) - intercept) / slope, is a Mobius transformation.
+    Written in u = 1/(x - k), with k a fixed point of the step, it becomes u -> lam * u + mu.
+    Returns k, lam, mu and whether a fixed point (pinch) lies between x_start and x_end.
+    """
+    a2 = slope * (alpha - 1)
+    a1 = slope - alpha + intercept * (alpha - 1)
+    a0 = intercept
+    root = np.sqrt(np.where(a1 ** 2 - 4 * a2 * a0 >= 0, a1 ** 2 - 4 * a2 * a0, np.nan))
+    k1 = (-a1 + root) / (2 * a2)
+    k2 = (-a1 - root) / (2 * a2)
+    low = np.minimum(x_start, x_end)
+    high = np.maximum(x_start, x_end)
+    pinch = ((low <= k1) & (k1 <= high)) | ((low <= k2) & (k2 <= high))
+
+    # Use the fixed point furthest away from the interval, it keeps u small.
+    middle = (low + high) / 2
+    k = np.where(np.abs(k1 - middle) > np.abs(k2 - middle), k1, k2)
+    den = alpha - intercept * (alpha - 1) - k * a2
+    lam = (a2 * k + slope) / den
+    mu = a2 / den
+    return k, lam, mu, pinch
+
+
+def smoker_stages(x_start: float | np.ndarray, x_end: float | np.ndarray, slope: float | np.ndarray,
+                  intercept: float | np.ndarray, alpha: float | np.ndarray):
+    """
+    Smoker's equation.
+    Fractional number of stages needed to step from x_start up to x_end between the operating line
+    y = slope * x + intercept and the vle curve with constant alpha.
+    inf if the operating line touches the vle curve in between, or lies above it.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        k, lam, mu, pinch = _smoker_constants(slope, intercept, alpha, x_start, x_end)
+        u_start = 1 / (x_start - k)
+        u_end = 1 / (x_end - k)
+        shift = mu / (lam - 1)
+        ans = np.log((u_end + shift) / (u_start + shift)) / np.log(lam)
+        ans = np.where(np.isclose(lam, 1.0, rtol=0.0, atol=1e-12), (u_end - u_start) / mu, ans)
+
+        forward = vapor_liquid_equilibrium(x_start, alpha) > slope * x_start + intercept
+        ans = np.where(pinch | np.logical_not(forward), np.inf, ans)
+        return np.where(x_end <= x_start, 0.0, ans)
+
+
+def smoker_step(x: float | np.ndarray, n: float | np.ndarray, slope: float | np.ndarray,
+                intercept: float | np.ndarray, alpha: float | np.ndarray):
+    """Liquid composition after n steps from x, the closed form of n steps of the staircase."""
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        k, lam, mu, _ = _smoker_constants(slope, intercept, alpha, x, x)
+        u = 1 / (x - k)
+        shift = mu / (lam - 1)
+        u_n = np.where(np.isclose(lam, 1.0, rtol=0.0, atol=1e-12), u + n * mu, (u + shift) * lam ** n - shift)
+        return k + 1 / u_n
+
+
+def smoker_column_stages(xb: float | np.ndarray, xd: float | np.ndarray, alpha: float | np.ndarray,
+                         rectifying_coef: tuple, stripping_coef: tuple, y_feed: float | np.ndarray):
+    """
+    Stages of a whole column with Smoker's equation, stepping from xb up to xd.
+    Like McCabeThieleLogic.make_equilibrium_points the stripping line is used
+    until the vapor gets richer than y_feed, the y of the q-point.
+    Returns the number of steps the staircase takes and the fractional number of stages.
+    """
+    eps = 1e-9
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x_switch = vapor_liquid_equilibrium_inverse(y_feed, alpha)
+
+        strip_to_xd = smoker_stages(xb, xd, *stripping_coef, alpha)
+        rect_to_xd = smoker_stages(xb, xd, *rectifying_coef, alpha)
+        strip_to_switch = smoker_stages(xb, x_switch, *stripping_coef, alpha)
+        rect_from_switch = smoker_stages(x_switch, xd, *rectifying_coef, alpha)
+
+        n_strip = np.floor(strip_to_switch) + 1
+        x_after_strip = smoker_step(xb, np.where(np.isfinite(n_strip), n_strip, 0), *stripping_coef, alpha)
+        rect_after_strip = smoker_stages(x_after_strip, xd, *rectifying_coef, alpha)
+        both = np.where(x_after_strip >= xd, np.ceil(strip_to_xd - eps), n_strip + np.ceil(rect_after_strip - eps))
+
+        only_strip = x_switch >= xd
+        only_rect = xb > x_switch
+        steps = np.where(only_strip, np.ceil(strip_to_xd - eps), np.where(only_rect, np.ceil(rect_to_xd - eps), both))
+        stages = np.where(only_strip, strip_to_xd, np.where(only_rect, rect_to_xd, strip_to_switch + rect_from_switch))
+
+        done = xb >= xd
+        return np.where(done, 0.0, steps), np.where(done, 0.0, stages)
+
+
+def pinch_composition(x_start: float | np.ndarray, x_end: float | np.ndarray, slope: float | np.ndarray,
+                      intercept: float | np.ndarray, alpha: float | np.ndarray):
+    """
+    Lowest x between x_start and x_end where the operating line y = slope * x + intercept
+    touches the vle curve with constant alpha, nan if it doesn't.
+    If the line already lies on or above the vle curve at x_start, that is the pinch.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Intersections solve slope*(alpha-1)*x^2 + (slope - alpha + intercept*(alpha-1))*x + intercept = 0
+        a2 = slope * (alpha - 1)
+        a1 = slope - alpha + intercept * (alpha - 1)
+        a0 = intercept
+        root = np.sqrt(np.where(a1 ** 2 - 4 * a2 * a0 >= 0, a1 ** 2 - 4 * a2 * a0, np.nan))
+        k1 = (-a1 + root) / (2 * a2)
+        k2 = (-a1 - root) / (2 * a2)
+        k1 = np.where((x_start <= k1) & (k1 <= x_end), k1, np.nan)
+        k2 = np.where((x_start <= k2) & (k2 <= x_end), k2, np.nan)
+        ans = np.fmin(k1, k2)
+
+        backward = np.logical_not(vapor_liquid_equilibrium(x_start, alpha) > slope * x_start + intercept)
+        ans = np.where(backward, x_start, ans)
+        return np.where(x_end > x_start, ans, np.nan)
+
+
+def column_pinch_composition(xb: float | np.ndarray, xd: float | np.ndarray, alpha: float | np.ndarray,
+                             rectifying_coef: tuple, stripping_coef: tuple, y_feed: float | np.ndarray,
+                             vle_model=None):
+    """
+    Lowest x where stepping from xb to xd gets stuck, nan if the column is feasible.
+    Uses the same switch from stripping to rectifying line as smoker_column_stages.
+    With a vle_model, like tools.vle.TabulatedVLE, alpha isn't used and the model finds the pinch.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if vle_model is None:
+            x_switch = vapor_liquid_equilibrium_inverse(y_feed, alpha)
+            strip = pinch_composition(xb, np.minimum(x_switch, xd), *stripping_coef, alpha)
+            rect = pinch_composition(np.maximum(x_switch, xb), xd, *rectifying_coef, alpha)
+        else:
+            x_switch = vle_model.inverse(y_feed)
+            strip = vle_model.pinch_composition(xb, np.minimum(x_switch, xd), *stripping_coef)
+            rect = vle_model.pinch_composition(np.maximum(x_switch, xb), xd, *rectifying_coef)
+        return np.fmin(strip, rect)
+
+
+def q_line_vle_intersection(xf: float | np.ndarray, q: float | np.ndarray, alpha: float | np.ndarray):
+    """
+    Point where the q-line through (xf, xf) meets the vle curve with constant alpha.
+    (q - 1) * y = q * x - xf together with the vle curve gives
+    q*(alpha-1)*x^2 + (q - xf*(alpha-1) - alpha*(q-1))*x - xf = 0,
+    the root is written so q = 1 (vertical) and q = 0 (horizontal) need no special case.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        a2 = q * (alpha - 1)
+        a1 = q - xf * (alpha - 1) - alpha * (q - 1)
+        x = 2 * xf / (a1 + np.sqrt(a1 ** 2 + 4 * a2 * xf))
+        return x, vapor_liquid_equilibrium(x, alpha)
+
+
+def minimum_reflux(xf: float | np.ndarray, xd: float | np.ndarray, alpha: float | np.ndarray,
+                   q: float | np.ndarray):
+    """
+    Minimum reflux ratio, binary Underwood.
+    With constant alpha the vle curve has no inflection, so the pinch is where the q-line meets the vle curve.
+    """
+    x, y = q_line_vle_intersection(xf, q, alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (xd - y) / (y - x)
+
+
+def minimum_boilup(xf: float | np.ndarray, xb: float | np.ndarray, alpha: float | np.ndarray,
+                   q: float | np.ndarray):
+    """Minimum boilup ratio, the stripping line counterpart of minimum_reflux."""
+    x, y = q_line_vle_intersection(xf, q, alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x - xb) / (y - x)
+
+
+def minimum_stages(xd: float | np.ndarray, xb: float | np.ndarray, alpha: float | np.ndarray):
+    """Fenske equation, fractional number of stages at total reflux."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(xd * (1 - xb) / ((1 - xd) * xb)) / np.log(alpha)
+
+
+def alpha_for_stages(n_stages: float | np.ndarray, xb: float | np.ndarray, xd: float | np.ndarray,
+                     rectifying_coef: tuple, stripping_coef: tuple, y_feed: float | np.ndarray,
+                     tol: float = 1e-10, max_iter: int = 200):
+    """
+    Constant alpha that gives the column n_stages fractional stages by smoker_column_stages.
+    The stage count only goes down with alpha, so bisection between alpha = 1, where nothing separates,
+    and an alpha found by doubling converges. nan where n_stages is never reached.
+    """
+    shape = np.broadcast_shapes(np.shape(n_stages), np.shape(xb), np.shape(xd), np.shape(y_feed),
+                                *(np.shape(coef) for coef in (*rectifying_coef, *stripping_coef)))
+
+    def too_many_stages(alpha):
+        # nan, from a pinch, counts as too many
+        return ~(smoker_column_stages(xb, xd, alpha, rectifying_coef, stripping_coef, y_feed)[1] <= n_stages)
+
+    low, high, open_ = roots.expand_bracket(too_many_stages, np.ones(shape), np.full(shape, 2.0))
+    high = roots.bisect(too_many_stages, low, high, tol, max_iter, skip=open_)
+    return np.where(open_, np.nan, high)
+
+
+def gilliland_stages(n_min: float | np.ndarray, r_min: float | np.ndarray, r: float | np.ndarray):
+    """
+    Number of stages at reflux ratio r, Gilliland correlation in the form of Eduljee:
+    Y = 0.75 * (1 - X^0.5668) with X = (r - r_min) / (r + 1) and Y = (N - n_min) / (N + 1).
+    inf at or below the minimum reflux ratio.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x = (r - r_min) / (r + 1)
+        y = 0.75 * (1 - np.power(np.where(x > 0, x, 0.0), 0.5668))
+        return np.where(x > 0, (n_min + y) / (1 - y), np.inf)
+
+
+def kirkbride_feed_ratio(xf: float | np.ndarray, xd: float | np.ndarray, xb: float | np.ndarray):
+    """
+    Kirkbride equation for a binary, number of stages above the feed over the number below it.
+    The light component is the light key, B/D follows from the component balance.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b_over_d = (xd - xf) / (xf - xb)
+        return ((1 - xf) / xf * (xb / (1 - xd)) ** 2 * b_over_d) ** 0.206
+
+
+def shortcut_design(xf: float | np.ndarray, xd: float | np.ndarray, xb: float | np.ndarray,
+                    alpha: float | np.ndarray, q: float | np.ndarray, r: float | np.ndarray):
+    """
+    Fenske-Underwood-Gilliland shortcut design.
+    Returns the minimum number of stages, the minimum reflux ratio, the fractional number of stages at r
+    and the feed stage counted from the top, the first stage below the Kirkbride rectifying section.
+    """
+    n_min = minimum_stages(xd, xb, alpha)
+    r_min = minimum_reflux(xf, xd, alpha, q)
+    n = gilliland_stages(n_min, r_min, r)
+    ratio = kirkbride_feed_ratio(xf, xd, xb)
+    with np.errstate(invalid='ignore'):
+        feed_stage = n * ratio / (1 + ratio) + 1
+    return n_min, r_min, n, feed_stage
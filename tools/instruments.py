@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class Instruments:
+    """
+    Opt-in timers and counters. Code that supports them takes an instruments argument,
+    None by default, and only checks for None when they are off.
+    Timers add up the seconds and calls of every phase, counters add up whatever is counted.
+    Callbacks are called as callback(name, seconds) after every timed phase, on the thread that ran it.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.callbacks = []
+        # The view's background solver records from its own thread
+        self._lock = threading.Lock()
+
+    def time(self, name, func, *args):
+        """Call func(*args), timed as phase name, and return its result."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+        for callback in self.callbacks:
+            callback(name, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def reset(self):
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'timers': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                'counters': dict(self.counters),
+            }
+
+    def summary(self):
+        """Table of the timers, slowest first, followed by the counters."""
+        data = self.as_dict()
+        rows = [f"{'phase':32s} {'calls':>8s} {'total ms':>10s} {'mean us':>10s}"]
+        for name, timer in sorted(data['timers'].items(), key=lambda item: -item[1]['seconds']):
+            seconds, calls = timer['seconds'], timer['calls']
+            rows.append(f"{name:32s} {calls:8d} {1e3 * seconds:10.2f} {1e6 * seconds / calls:10.1f}")
+        for name, value in sorted(data['counters'].items()):
+            rows.append(f"{name:32s} {value:8d}")
+        return '\n'.join(rows)
+
+
+def timed(instruments, name, func, *args):
+    """func(*args), timed when instruments isn't None."""
+    if instruments is None:
+        return func(*args)
+    return instruments.time(name, func, *args)
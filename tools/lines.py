@@ -1,3 +1,6 @@
+import numpy as np
+
+
 
 
 def intersect(a1, b1, a2, b2):
@@ -28,5 +31,49 @@ def get_y(x, a, b):
 
 
 def intersect_from_slope_and_point(a, x, y):
+    """If vertical line: return x, like through_points"""
+    if float('inf') == a:
+        return x
     return y - a * x
 
+
+# Vectorized versions, for numpy arrays of line coefficients.
+# A vertical line has slope inf and its x as intercept, like through_points.
+# Degenerate cases give nan instead of None or an exception.
+
+def intersect_vectorized(a1, b1, a2, b2):
+    """nan where the lines are parallel, vertical lines are allowed."""
+    a1, b1, a2, b2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (a1, b1, a2, b2)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.where(a1 == a2, np.nan, (b2 - b1) / (a1 - a2))
+        y = a1 * x + b1
+        vertical1 = np.isinf(a1) & ~np.isinf(a2)
+        vertical2 = np.isinf(a2) & ~np.isinf(a1)
+        x = np.where(vertical1, b1, np.where(vertical2, b2, x))
+        y = np.where(vertical1, a2 * b1 + b2, np.where(vertical2, a1 * b2 + b1, y))
+    return x, y
+
+
+def through_points_vectorized(x1, y1, x2, y2):
+    """Where x1 == x2: slope inf and intercept x1."""
+    x1, y1, x2, y2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x1, y1, x2, y2)))
+    vertical = x1 == x2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = np.where(vertical, np.inf, (y2 - y1) / (x2 - x1))
+        b = np.where(vertical, x1, y1 - a * x1)
+    return a, b
+
+
+def intersect_from_slope_and_point_vectorized(a, x, y):
+    """Where the slope is inf the line is vertical, and the intercept is x."""
+    a, x, y = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (a, x, y)))
+    with np.errstate(invalid='ignore', over='ignore'):
+        return np.where(np.isinf(a), x, y - a * x)
+
+
+def closest_point_on_line_vectorized(a1, b1, x, y):
+    a1 = np.asarray(a1, dtype=float)
+    with np.errstate(divide='ignore'):
+        a2 = np.where(a1 == 0, np.inf, -1 / a1)
+    b2 = intersect_from_slope_and_point_vectorized(a2, x, y)
+    return intersect_vectorized(a1, b1, a2, b2)
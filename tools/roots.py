@@ -0,0 +1,38 @@
+import numpy as np
+
+MAX_EXPANSIONS = 64
+
+
+def expand_bracket(too_low, low, high, max_expansions=MAX_EXPANSIONS):
+    """
+    Double high, moving low up to it, until too_low(high) is False everywhere.
+    too_low(x) is a boolean array, True where the root lies above x.
+    Returns low, high and a boolean array that is True where no bracket was found.
+    """
+    open_ = too_low(high)
+    for _ in range(max_expansions):
+        if not open_.any():
+            break
+        low = np.where(open_, high, low)
+        high = np.where(open_, 2 * high, high)
+        open_ = too_low(high)
+    return low, high, open_
+
+
+def bisect(too_low, low, high, tol, max_iter, skip=None):
+    """
+    Vectorized bisection of the brackets low to high, until they are narrower than tol * high.
+    too_low is like in expand_bracket, it is called with all elements at once,
+    the converged ones and those where skip is True get high and are left alone.
+    Returns high, the end where too_low is False.
+    """
+    skip = np.zeros(np.shape(high), dtype=bool) if skip is None else skip
+    for _ in range(max_iter):
+        unconverged = ~skip & (high - low > tol * high)
+        if not unconverged.any():
+            break
+        middle = np.where(unconverged, 0.5 * (low + high), high)
+        too_low_middle = too_low(middle)
+        low = np.where(unconverged & too_low_middle, middle, low)
+        high = np.where(unconverged & ~too_low_middle, middle, high)
+    return high
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class StreamingStats:
+    """
+    Count, mean, variance, min, max and a histogram of values that arrive in chunks, in bounded memory.
+    Mean and variance are merged with the pairwise formulas of Chan et al., so chunks can be processed
+    separately and merged, merging in the same order gives the same result.
+    Quantiles come from the histogram, values outside its edges are counted below and above it.
+    With discrete the bins are integers, edges k - 0.5 to k + 0.5, and quantiles are exact.
+    """
+
+    def __init__(self, edges, discrete=False):
+        self.edges = np.asarray(edges, dtype=float)
+        self.discrete = discrete
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+
+    @classmethod
+    def integers(cls, n_max):
+        """For the integers 0 to n_max."""
+        return cls(np.arange(n_max + 2) - 0.5, discrete=True)
+
+    def empty_copy(self):
+        return type(self)(self.edges, self.discrete)
+
+    def update(self, values):
+        """Add the finite values of an array."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[np.isfinite(values)]
+        if 0 == values.size:
+            return
+        chunk = self.empty_copy()
+        chunk.n = values.size
+        chunk.mean = float(np.mean(values))
+        chunk.m2 = float(np.sum((values - chunk.mean) ** 2))
+        chunk.min = float(np.min(values))
+        chunk.max = float(np.max(values))
+        chunk.histogram = np.histogram(values, self.edges)[0].astype(np.int64)
+        chunk.below = int(np.count_nonzero(values < self.edges[0]))
+        chunk.above = int(np.count_nonzero(values > self.edges[-1]))
+        self.merge(chunk)
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Can only merge statistics with the same histogram edges. ")
+        if 0 == other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram += other.histogram
+        self.below += other.below
+        self.above += other.above
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    def quantile(self, q):
+        """
+        Quantile from the histogram, interpolated within a bin, or the bin itself when discrete.
+        Quantiles that fall below or above the histogram give min or max.
+        """
+        if 0 == self.n:
+            return np.nan
+        rank = q * self.n
+        if rank < self.below:
+            return self.min
+        cumulative = self.below + np.cumsum(self.histogram)
+        i = int(np.searchsorted(cumulative, rank, side='left'))
+        if i >= len(self.histogram):
+            return self.max
+        if self.discrete:
+            return float(self.edges[i] + 0.5)
+        before = cumulative[i] - self.histogram[i]
+        fraction = (rank - before) / self.histogram[i] if self.histogram[i] else 0.0
+        return float(self.edges[i] + fraction * (self.edges[i + 1] - self.edges[i]))
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        result = {'n': self.n, 'mean': self.mean if self.n else np.nan, 'std': self.std, 'min': self.min, 'max': self.max}
+        result.update({f"q{100 * q:g}": self.quantile(q) for q in quantiles})
+        return result
@@ -0,0 +1,206 @@
+import numpy as np
+
+
+def _pchip_slopes(x: np.ndarray, y: np.ndarray):
+    """Fritsch-Carlson slopes, the cubic Hermite interpolant through x, y with them is monotone."""
+    h = np.diff(x)
+    delta = np.diff(y) / h
+    d = np.zeros_like(y)
+
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = delta[:-1] * delta[1:] > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d[1:-1] = np.where(same_sign, (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:]), 0.0)
+
+    def edge(h0, h1, delta0, delta1):
+        slope = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+        if np.sign(slope) != np.sign(delta0):
+            return 0.0
+        if np.sign(delta0) != np.sign(delta1) and abs(slope) > abs(3 * delta0):
+            return 3 * delta0
+        return slope
+
+    if len(x) == 2:
+        d[:] = delta[0]
+    else:
+        d[0] = edge(h[0], h[1], delta[0], delta[1])
+        d[-1] = edge(h[-1], h[-2], delta[-1], delta[-2])
+    return d
+
+
+def _pchip(x: np.ndarray, y: np.ndarray, d: np.ndarray, t: np.ndarray):
+    i = np.clip(np.searchsorted(x, t, side='right') - 1, 0, len(x) - 2)
+    h = x[i + 1] - x[i]
+    s = (t - x[i]) / h
+    h00 = (1 + 2 * s) * (1 - s) ** 2
+    h10 = s * (1 - s) ** 2
+    h01 = s ** 2 * (3 - 2 * s)
+    h11 = s ** 2 * (s - 1)
+    return h00 * y[i] + h10 * h * d[i] + h01 * y[i + 1] + h11 * h * d[i + 1]
+
+
+class TabulatedVLE:
+    """
+    Vapor liquid equilibrium from measured x-y points, for mixtures that don't have a constant alpha.
+    The points are joined by a monotone cubic (PCHIP) interpolant, which is sampled once
+    into a table uniform in x, and inverted once into a table uniform in y.
+    A lookup is then a linear interpolation between 2 neighbouring table entries, no searching,
+    and a Python float goes through plain Python arithmetic, so stepping stays about as cheap
+    as chemistry.vapor_liquid_equilibrium.
+    """
+    DEFAULT_TABLE_SIZE = 4096
+    PINCH_SAMPLES = 512
+
+    def __init__(self, x, y, table_size=None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        order = np.argsort(x)
+        x, y = x[order], y[order]
+        # Pure components are always in equilibrium with themselves
+        if x[0] > 0.0:
+            x, y = np.concatenate(([0.0], x)), np.concatenate(([0.0], y))
+        if x[-1] < 1.0:
+            x, y = np.concatenate((x, [1.0])), np.concatenate((y, [1.0]))
+        if np.any(np.diff(x) <= 0):
+            raise ValueError("VLE data has repeated x values. ")
+        if np.any(np.diff(y) < 0):
+            raise ValueError("VLE data must have y increasing with x. ")
+        self.x_data = x
+        self.y_data = y
+
+        n = table_size if table_size is not None else self.DEFAULT_TABLE_SIZE
+        self.table_size = n
+        grid = np.linspace(0.0, 1.0, n + 1)
+        self.y_table = _pchip(x, y, _pchip_slopes(x, y), grid)
+        self.x_table = np.interp(grid, self.y_table, grid)
+        self._y_list = self.y_table.tolist()
+        self._x_list = self.x_table.tolist()
+
+    @classmethod
+    def from_csv(cls, path, table_size=None, **kwargs):
+        """Whitespace separated x y columns like the files in res/, kwargs go to np.loadtxt."""
+        data = np.loadtxt(path, **kwargs)
+        return cls(data[:, 0], data[:, 1], table_size)
+
+    def _lookup(self, table, v):
+        t = np.clip(np.asarray(v, dtype=float), 0.0, 1.0) * self.table_size
+        i = np.minimum(t.astype(int), self.table_size - 1)
+        return table[i] + (table[i + 1] - table[i]) * (t - i)
+
+    def __call__(self, x):
+        """y in equilibrium with x"""
+        if isinstance(x, float):
+            n = self.table_size
+            t = (0.0 if x < 0.0 else 1.0 if x > 1.0 else float(x)) * n
+            i = int(t) if t < n else n - 1
+            y0 = self._y_list[i]
+            return y0 + (self._y_list[i + 1] - y0) * (t - i)
+        return self._lookup(self.y_table, x)
+
+    def inverse(self, y):
+        """x in equilibrium with y"""
+        if isinstance(y, float):
+            n = self.table_size
+            t = (0.0 if y < 0.0 else 1.0 if y > 1.0 else float(y)) * n
+            i = int(t) if t < n else n - 1
+            x0 = self._x_list[i]
+            return x0 + (self._x_list[i + 1] - x0) * (t - i)
+        return self._lookup(self.x_table, y)
+
+    def pinch_composition(self, x_start, x_end, slope, intercept):
+        """
+        Lowest x between x_start and x_end where the operating line y = slope * x + intercept
+        reaches the vle curve, nan if it doesn't. Found by sampling, so a line that only
+        just touches the curve between 2 samples can be missed.
+        """
+        x_start, x_end, slope, intercept = np.broadcast_arrays(
+            *(np.asarray(v, dtype=float) for v in (x_start, x_end, slope, intercept)))
+        ans = np.full(x_start.shape, np.nan)
+        s = np.linspace(0.0, 1.0, self.PINCH_SAMPLES)
+        # Chunks of cases, so the (cases, samples) arrays stay small
+        chunk = max(1, 2 ** 18 // self.PINCH_SAMPLES)
+        flat = [v.ravel() for v in (x_start, x_end, slope, intercept)]
+        out = ans.ravel()
+        for start in range(0, out.size, chunk):
+            x0, x1, a, b = (v[start:start + chunk, None] for v in flat)
+            xs = x0 + (x1 - x0) * s
+            gap = self(xs) - (a * xs + b)
+            touching = gap <= 0
+            first = np.argmax(touching, axis=1)
+            rows = np.arange(len(first))
+            found = touching[rows, first] & (x1[:, 0] > x0[:, 0])
+            # Linear interpolation of the gap between the last sample above and the first sample on the line
+            prev = np.maximum(first - 1, 0)
+            g0, g1 = gap[rows, prev], gap[rows, first]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frac = np.where(first > 0, g0 / (g0 - g1), 0.0)
+            x = xs[rows, prev] + (xs[rows, first] - xs[rows, prev]) * frac
+            out[start:start + chunk] = np.where(found, x, np.nan)
+        return out.reshape(x_start.shape) if x_start.shape else float(out[0])
+
+
+class RaoultVLE(TabulatedVLE):
+    """
+    Ideal vapor liquid equilibrium from Raoult's law, with Antoine vapor pressures log10(p) = a - b / (c + T).
+    light and heavy are the (a, b, c) constants of the 2 components, pressure is in the units of the constants.
+    The bubble point temperatures and vapor compositions are solved once for the whole table grid,
+    with Newton steps on all points at once, after which lookups work like in TabulatedVLE.
+    """
+    MAX_ITER = 50
+    TOLERANCE = 1e-10
+
+    def __init__(self, light, heavy, pressure, table_size=None):
+        self.light = tuple(float(v) for v in light)
+        self.heavy = tuple(float(v) for v in heavy)
+        self.pressure = float(pressure)
+        if not self.boiling_point(self.light) < self.boiling_point(self.heavy):
+            raise ValueError("The light component must have the lowest boiling point. ")
+
+        n = table_size if table_size is not None else self.DEFAULT_TABLE_SIZE
+        grid = np.linspace(0.0, 1.0, n + 1)
+        t, y = self.bubble_point(grid)
+        super().__init__(grid, y, n)
+        self.t_table = t
+
+    @staticmethod
+    def vapor_pressure(t, constants):
+        a, b, c = constants
+        return 10.0 ** (a - b / (c + t))
+
+    def boiling_point(self, constants):
+        """Boiling point of a pure component at pressure"""
+        a, b, c = constants
+        return b / (a - np.log10(self.pressure)) - c
+
+    def bubble_point(self, x):
+        """
+        Bubble point temperature and vapor composition of liquid x, of any shape.
+        Newton steps on ln(x p_light + (1 - x) p_heavy) = ln(pressure), which is close to linear in T,
+        for all points at once, starting from the linear interpolation of the pure boiling points.
+        """
+        x = np.asarray(x, dtype=float)
+        a1, b1, c1 = self.light
+        a2, b2, c2 = self.heavy
+        log_pressure = np.log(self.pressure)
+        t = x * self.boiling_point(self.light) + (1 - x) * self.boiling_point(self.heavy)
+        for _ in range(self.MAX_ITER):
+            p1 = x * self.vapor_pressure(t, self.light)
+            p2 = (1 - x) * self.vapor_pressure(t, self.heavy)
+            total = p1 + p2
+            slope = np.log(10.0) * (p1 * b1 / (c1 + t) ** 2 + p2 * b2 / (c2 + t) ** 2) / total
+            step = (np.log(total) - log_pressure) / slope
+            t = t - step
+            if not np.max(np.abs(step), where=~np.isnan(step), initial=0.0) > self.TOLERANCE:
+                break
+        y = x * self.vapor_pressure(t, self.light) / self.pressure
+        return t, y
+
+    def temperature(self, x):
+        """Bubble point temperature of liquid x, from a table like __call__"""
+        return self._lookup(self.t_table, x)
+
+    def relative_volatility(self, x):
+        """alpha = p_light / p_heavy at the bubble point of x"""
+        t = self.temperature(x)
+        return self.vapor_pressure(t, self.light) / self.vapor_pressure(t, self.heavy)